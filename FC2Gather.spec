@@ -5,8 +5,8 @@ a = Analysis(
     ['fc2_gui.py'],
     pathex=[],
     binaries=[],
-    datas=[('fc2_core.py', '.'), ('ico.ico', '.')],
-    hiddenimports=['fc2_core', 'dukpy', 'pypac'],
+    datas=[('fc2_core.py', '.'), ('fc2_parser.py', '.'), ('ico.ico', '.')],
+    hiddenimports=['fc2_core', 'fc2_parser', 'dukpy', 'pypac'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
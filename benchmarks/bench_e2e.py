@@ -0,0 +1,232 @@
+# -*- coding:utf-8 -*-
+"""
+端到端基准：在本地模拟服务器（fc2_stub_server.py）或 HTTP 回放存档上，按不同番号数量与线程数
+运行卖家列表抓取（get_fc2_ids_from_url）与磁力获取（process_fc2_list），
+报告 番号/秒、各请求耗时的 p50/p95/p99、峰值内存与 CPU 时间，并可写出 JSON 便于版本间对比。
+
+每个组合在单独的子进程中运行（峰值内存与 CPU 时间互不影响，模拟服务器运行在父进程中不计入）。
+
+用法：
+  python benchmarks/bench_e2e.py [--sizes 100,1000,10000] [--workers 2,8] [--title-mode 完整]
+                                 [--latency 0] [--rate-429 0] [--output bench.json]
+  使用回放存档（先以 Http_archive=录制 正常运行一次）：
+  python benchmarks/bench_e2e.py --archive Downloads/http_archive.db --listing-url https://adult.contents.fc2.com/users/xxx/articles
+"""
+
+import argparse
+import configparser
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def percentile(values, pct):
+    """最近秩百分位数，values 为空时返回 0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def latency_summary(values):
+    """请求耗时统计（毫秒）"""
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 50) * 1000, 2),
+        'p95_ms': round(percentile(values, 95) * 1000, 2),
+        'p99_ms': round(percentile(values, 99) * 1000, 2),
+        'max_ms': round(max(values) * 1000, 2) if values else 0.0,
+    }
+
+
+def peak_rss_mb():
+    """本进程的峰值内存（MB），无法获取时返回 None"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 为 KB，macOS 为字节
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / 1024 / 1024, 1)
+    except Exception:
+        return None
+
+
+def run_case(case):
+    """子进程：按 case 配置运行一次抓取与磁力获取，返回结果字典"""
+    from fc2_core import FC2GatherCore, site_of
+
+    download_path = tempfile.mkdtemp(prefix='fc2_bench_')
+    config = configparser.RawConfigParser()
+    config['下载设置'] = {
+        'Download_path': download_path,
+        'AutoProxy': '否',
+        'Proxy': '否',
+        'Cache': '否',
+        'Max_dl': str(case['workers']),
+        'Workers_fc2': str(case['workers']),
+        'Workers_sukebei': str(case['workers']),
+        'Rate_fc2': str(case['rate']),
+        'Rate_sukebei': str(case['rate']),
+        'Search_batch': str(case['search_batch']),
+        'Stream': case['stream'],
+        'Dedupe': '否',
+    }
+    if case.get('archive'):
+        config['下载设置']['Http_archive'] = '回放'
+        config['下载设置']['Http_archive_file'] = case['archive']
+    else:
+        config['下载设置']['FC2_base_url'] = case['fc2_url']
+        config['下载设置']['Sukebei_base_url'] = case['sukebei_url']
+
+    core = FC2GatherCore(config, log_callback=lambda message: None)
+    latencies = {}
+    fetch_page = core.fetch_page
+
+    def timed_fetch_page(url, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fetch_page(url, *args, **kwargs)
+        finally:
+            latencies.setdefault(site_of(url), []).append(time.perf_counter() - start)
+
+    core.fetch_page = timed_fetch_page
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    fc2_ids = core.get_fc2_ids_from_url(case['listing_url'])[:case['size']]
+    crawl_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = core.process_fc2_list('\n'.join(fc2_ids), title_mode=case['title_mode'])
+    magnet_seconds = time.perf_counter() - start
+    cpu_seconds = time.process_time() - cpu_start
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        'size': case['size'],
+        'workers': case['workers'],
+        'title_mode': case['title_mode'],
+        'search_batch': case['search_batch'],
+        'ids': len(fc2_ids),
+        'results': len(results),
+        'with_magnets': sum(1 for info in results if info.get('magnets')),
+        'crawl_seconds': round(crawl_seconds, 3),
+        'magnet_seconds': round(magnet_seconds, 3),
+        'ids_per_second': round(len(results) / magnet_seconds, 2) if magnet_seconds > 0 else 0.0,
+        'requests': len(all_latencies),
+        'latency': latency_summary(all_latencies),
+        'latency_by_site': {site: latency_summary(values) for site, values in latencies.items()},
+        'cpu_seconds': round(cpu_seconds, 3),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def spawn_case(case):
+    """在子进程中运行一个组合，返回其结果"""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--case', json.dumps(case, ensure_ascii=False)],
+        capture_output=True, text=True, encoding='utf-8', check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='端到端基准')
+    parser.add_argument('--sizes', default='100,1000,10000', help='番号数量，逗号分隔')
+    parser.add_argument('--workers', default='2,8', help='线程数，逗号分隔')
+    parser.add_argument('--title-mode', default='完整', help='标题获取方式：完整/仅磁力/延迟')
+    parser.add_argument('--search-batch', type=int, default=1, help='sukebei 合并查询的番号数')
+    parser.add_argument('--stream', default='是', help='流式读取（是/否）')
+    parser.add_argument('--rate', type=float, default=0, help='每站点每秒请求数，0 为不限速')
+    parser.add_argument('--cards', type=int, default=60, help='模拟服务器每页作品数')
+    parser.add_argument('--pad-kb', type=int, default=40, help='模拟服务器页面填充大小（KB）')
+    parser.add_argument('--latency', type=float, default=0, help='模拟服务器基础延迟（毫秒）')
+    parser.add_argument('--jitter', type=float, default=0, help='模拟服务器延迟波动（毫秒）')
+    parser.add_argument('--rate-429', type=float, default=0, help='模拟服务器返回 429 的概率')
+    parser.add_argument('--rate-5xx', type=float, default=0, help='模拟服务器返回 5xx 的概率')
+    parser.add_argument('--rate-reset', type=float, default=0, help='模拟服务器重置连接的概率')
+    parser.add_argument('--archive', help='使用 HTTP 回放存档代替模拟服务器')
+    parser.add_argument('--listing-url', help='回放存档中的卖家列表页网址')
+    parser.add_argument('--output', help='结果 JSON 文件')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case)), ensure_ascii=False))
+        return
+    if args.archive and not args.listing_url:
+        parser.error('使用 --archive 时需要指定 --listing-url')
+
+    import fc2_stub_server
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    worker_counts = [int(count) for count in args.workers.split(',') if count.strip()]
+    cases = []
+    for size in sizes:
+        for workers in worker_counts:
+            case = {
+                'size': size, 'workers': workers, 'title_mode': args.title_mode,
+                'search_batch': args.search_batch, 'stream': args.stream, 'rate': args.rate,
+            }
+            stop = None
+            if args.archive:
+                case.update(archive=os.path.abspath(args.archive), listing_url=args.listing_url)
+            else:
+                fc2_url, sukebei_url, stop, state = fc2_stub_server.start_servers(
+                    pages=max(1, math.ceil(size / args.cards)), cards=args.cards, pad_kb=args.pad_kb,
+                    latency=args.latency, jitter=args.jitter, rate_429=args.rate_429,
+                    rate_5xx=args.rate_5xx, rate_reset=args.rate_reset, retry_after=0,
+                )
+                case.update(fc2_url=fc2_url, sukebei_url=sukebei_url,
+                            listing_url=f'{fc2_url}/users/bench/articles?sort=date&order=desc')
+            try:
+                result = spawn_case(case)
+            finally:
+                if stop is not None:
+                    stop()
+            if stop is not None:
+                result['server'] = state.stats
+            cases.append(result)
+            lat = result['latency']
+            print(f"番号 {result['ids']:>6}  线程 {workers:>3}  抓取 {result['crawl_seconds']:>7.2f}s  "
+                  f"磁力 {result['magnet_seconds']:>7.2f}s  {result['ids_per_second']:>8.1f} 番号/秒  "
+                  f"请求 {result['requests']:>6}  p50/p95/p99 {lat['p50_ms']}/{lat['p95_ms']}/{lat['p99_ms']} ms  "
+                  f"CPU {result['cpu_seconds']:.2f}s  内存峰值 {result['peak_rss_mb']} MB")
+
+    if args.output:
+        report = {
+            'version': git_version(),
+            'python': sys.version.split()[0],
+            'platform': sys.platform,
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'options': {key: value for key, value in vars(args).items() if key not in ('case', 'output')},
+            'cases': cases,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
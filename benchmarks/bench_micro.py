@@ -0,0 +1,218 @@
+# -*- coding:utf-8 -*-
+"""
+解析热点微基准：在不同大小的页面语料上测量各解析函数的单次耗时与内存分配（tracemalloc），
+可与基准 JSON 对比，耗时或分配超出阈值时以非零状态退出，便于及时发现正则相关的性能回退。
+
+语料缺省由 fc2_stub_server 的页面生成器按多种大小生成；也可使用保存的页面：
+  --corpus DIR     目录下的 .html 文件（按内容识别为列表页/作品页/搜索页）
+  --archive FILE   HTTP 存档（Http_archive=录制 时生成）中的全部页面
+
+用法：python benchmarks/bench_micro.py [--min-time 0.2] [--output micro.json]
+                                       [--baseline micro.json --threshold 0.3]
+"""
+
+import argparse
+import configparser
+import json
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fc2_parser
+import fc2_stub_server
+from fc2_core import FC2GatherCore
+
+LISTING_URL = 'https://adult.contents.fc2.com/users/example/articles?sort=date&order=desc'
+
+
+def page_kind(html):
+    """按内容识别页面类型：listing/search/article"""
+    if 'c-cntCard-110-f' in html:
+        return 'listing'
+    if 'magnet:?' in html or 'torrent-list' in html:
+        return 'search'
+    return 'article'
+
+
+def generated_corpus():
+    """由模拟服务器的页面生成器生成各类型、多种大小的页面：[(类型, 名称, 内容)]"""
+    corpus = []
+    for pad_kb, cards in ((0, 20), (40, 60), (300, 60)):
+        options = dict(fc2_stub_server.DEFAULT_OPTIONS, pages=50, cards=cards, pad_kb=pad_kb)
+        corpus.append(('listing', f'列表页 {cards}卡片 填充{pad_kb}KB',
+                       fc2_stub_server.render_listing('example', 3, options)))
+        corpus.append(('article', f'作品页 填充{pad_kb}KB', fc2_stub_server.render_article(1234567, options)))
+    for ids, pad_kb in ((0, 40), (1, 40), (25, 40), (25, 300)):
+        options = dict(fc2_stub_server.DEFAULT_OPTIONS, magnets=3, pad_kb=pad_kb)
+        query = ' '.join(str(3000000 + i * 7) for i in range(ids)) or 'none'
+        corpus.append(('search', f'搜索页 {ids}番号 填充{pad_kb}KB', fc2_stub_server.render_search(query, options)))
+    return corpus
+
+
+def input_corpus():
+    """用户输入的番号文本：标准格式、混合格式与含大量无关数字的文本"""
+    standard = '\n'.join(f'FC2-PPV-{1000000 + i}' for i in range(1000))
+    mixed = '\n'.join(
+        f'{i}. FC2 PPV {2000000 + i} 2024-01-{i % 28 + 1:02d} # 备注 {i}' if i % 3 else f'{2000000 + i}'
+        for i in range(1000)
+    )
+    return [('input', '输入 1000行 标准格式', standard), ('input', '输入 1000行 混合格式', mixed)]
+
+
+def file_corpus(directory):
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(('.html', '.htm')):
+            with open(os.path.join(directory, name), encoding='utf-8', errors='replace') as f:
+                html = f.read()
+            corpus.append((page_kind(html), name, html))
+    return corpus
+
+
+def archive_corpus(path):
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute('SELECT url, body FROM exchanges WHERE status = 200').fetchall()
+    finally:
+        conn.close()
+    corpus = []
+    for url, body in rows:
+        html = zlib.decompress(body).decode('utf-8', errors='replace')
+        corpus.append((page_kind(html), url, html))
+    return corpus
+
+
+def targets():
+    """各类型页面上要测量的函数：{类型: [(名称, 函数(内容))]}"""
+    import fc2_gather
+
+    config = configparser.RawConfigParser()
+    config['下载设置'] = {}
+    core = FC2GatherCore(config, log_callback=lambda message: None)
+    return {
+        'input': [
+            ('FC2GatherCore.parse_fc2_id', core.parse_fc2_id),
+        ],
+        'listing': [
+            ('FC2GatherCore.parse_fc2_id_from_url', core.parse_fc2_id_from_url),
+            ('FC2GatherCore.fc2_get_next_page', core.fc2_get_next_page),
+            ('FC2GatherCore.detect_fc2_page_type', lambda html: core.detect_fc2_page_type(html, LISTING_URL)),
+            ('fc2_gather.parse_fc2id', fc2_gather.parse_fc2id),
+        ],
+        'article': [
+            ('FC2GatherCore._parse_article', core._parse_article),
+        ],
+        'search': [
+            ('FC2GatherCore._parse_search', core._parse_search),
+            ('search_sukebei 排序', lambda html: fc2_parser.rank_rows(core._parse_search(html)['rows'], '做种', 1)),
+            ('fc2_gather.parse_magnet', fc2_gather.parse_magnet),
+        ],
+    }
+
+
+def measure(func, text, min_time):
+    """单次耗时（取 5 轮中最快一轮的平均值，秒）与单次调用的内存分配（峰值/留存字节）"""
+    func(text)
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func(text)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 5 or loops >= 1 << 20:
+            break
+        loops *= 2
+    best = elapsed
+    for _ in range(4):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func(text)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = func(text)
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return best / loops, peak - before, after - before
+
+
+def compare(results, baseline_path, threshold):
+    """与基准对比，返回回退的条目文本"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['function'], r['page']): r for r in json.load(f)['results']}
+    regressions = []
+    for r in results:
+        old = baseline.get((r['function'], r['page']))
+        if not old:
+            continue
+        for key, label in (('us_per_call', '耗时'), ('peak_kb', '峰值分配')):
+            if old[key] > 0 and r[key] > old[key] * (1 + threshold) and r[key] - old[key] > 1:
+                regressions.append(f"{r['function']} @ {r['page']}: {label} {old[key]} -> {r[key]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='解析热点微基准')
+    parser.add_argument('--corpus', help='保存的页面目录（.html）')
+    parser.add_argument('--archive', help='HTTP 存档文件')
+    parser.add_argument('--min-time', type=float, default=0.2, help='每项最少测量时间（秒）')
+    parser.add_argument('--output', help='结果 JSON 文件')
+    parser.add_argument('--baseline', help='用于对比的基准 JSON 文件')
+    parser.add_argument('--threshold', type=float, default=0.3, help='判定回退的相对阈值（耗时受机器负载影响，分配量稳定）')
+    args = parser.parse_args()
+
+    corpus = input_corpus()
+    if args.corpus:
+        corpus += file_corpus(args.corpus)
+    if args.archive:
+        corpus += archive_corpus(args.archive)
+    if not args.corpus and not args.archive:
+        corpus += generated_corpus()
+
+    results = []
+    functions = targets()
+    for kind, name, text in corpus:
+        for function, func in functions.get(kind, []):
+            seconds, peak, retained = measure(func, text, args.min_time)
+            result = {
+                'function': function,
+                'page': name,
+                'page_kb': round(len(text) / 1024, 1),
+                'us_per_call': round(seconds * 1e6, 2),
+                'peak_kb': round(peak / 1024, 1),
+                'retained_kb': round(retained / 1024, 1),
+            }
+            results.append(result)
+            print(f"{function:<40} {name:<28} {result['page_kb']:>8.1f}KB  "
+                  f"{result['us_per_call']:>10.2f} µs/次  峰值分配 {result['peak_kb']:>8.1f}KB  "
+                  f"留存 {result['retained_kb']:>6.1f}KB")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'created_at': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': sys.version.split()[0],
+                       'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.threshold)
+        if regressions:
+            print(f"\n发现 {len(regressions)} 项性能回退（阈值 {args.threshold:.0%}）：")
+            for line in regressions:
+                print('  ' + line)
+            sys.exit(1)
+        print('\n与基准相比没有性能回退')
+
+
+if __name__ == '__main__':
+    main()
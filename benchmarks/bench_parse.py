@@ -0,0 +1,132 @@
+# -*- coding:utf-8 -*-
+"""
+列表页解析基准：分别对比番号提取（原卡片正则 / fc2_parser.listing_ids）、分页解析（原分页正则 /
+fc2_parser.parse_pager）与整页解析的耗时，以及分页结构变化的页面上原下一页正则与 parse_pager 的耗时。
+番号提取与分页分开报告，避免其中一项的回退被另一项的加速掩盖。
+
+用法：python benchmarks/bench_parse.py [--cards 60] [--pages 50] [--filler 800] [--repeat 200] [--spans 2000]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fc2_parser
+
+
+def build_listing_page(cards=60, pages=50, current=3, filler=800):
+    """生成与 FC2 作品列表页结构相近的页面：头部脚本、作品卡片、分页"""
+    head = '<html><head>' + ('<script>var x = "' + 'a' * filler + '";</script>') * 20 + '</head><body>'
+    items = []
+    for i in range(cards):
+        article_id = 4000000 + i
+        items.append(
+            '<div class="c-cntCard-110-f"><div class="c-cntCard-110-f_thumb">'
+            f'<a href="/article/{article_id}/"><img src="//storage.fc2.com/{article_id}.jpg" alt=""></a></div>'
+            f'<div class="c-cntCard-110-f_itemName"><a href="/article/{article_id}/" title="作品 {article_id}">'
+            f'作品 {article_id}</a></div><div class="c-cntCard-110-f_price">{i * 10} pt</div></div>'
+        )
+    pager = ['<div class="c-pager-101">']
+    for p in range(1, pages + 1):
+        if p == current:
+            pager.append(f'<span class="items" aria-selected="true">{p}</span>')
+        else:
+            pager.append(
+                '<a data-pjx="pjx-container" data-link-name="pager" '
+                f'href="/users/example/articles?sort=date&amp;order=desc&amp;page={p}" class="items">{p}</a>'
+            )
+    pager.append('</div>')
+    return head + ''.join(items) + ''.join(pager) + '<footer>' + 'f' * filler * 10 + '</footer></body></html>'
+
+
+def build_malformed_page(spans=2000):
+    """分页结构变化的页面：分页链接属性顺序改变，分页之后还有大量 span"""
+    return ('<div class="c-pager-101"><span class="items" aria-selected="true">1</span>'
+            '<a class="items" href="/users/example/articles?page=2" data-link-name="pager">2</a></div>'
+            + '<div><span>x</span></div>' * spans)
+
+
+LEGACY_NEXT_PAGE = re.compile(
+    '<span class="items" aria-selected="true">.*?</span>.*?<a data-pjx="pjx-container" '
+    'data-link-name="pager".*?href=".*?&page=([0-9]*)" class="items">.*?<', re.S)
+
+
+def legacy_listing_ids(html):
+    """原 FC2GatherCore 的番号提取：卡片正则，无卡片时取全部作品链接"""
+    ids = re.findall(re.compile(r'<div class="c-cntCard-110-f">.*?<a href="/article/(\d+)/"', re.S), html)
+    if not ids:
+        ids = re.findall(re.compile(r'/article/(\d+)/'), html)
+    seen = set()
+    return [i for i in ids if not (i in seen or seen.add(i))]
+
+
+def legacy_pager(html):
+    """原 FC2GatherCore 的分页解析：当前页、下一页、末页各自扫描全文"""
+    keys = re.findall(re.compile('<span class="items" aria-selected="true">([0-9]*)</span>', re.S), html)
+    current_page = int(keys[0]) if keys else 1
+    keys = re.findall(LEGACY_NEXT_PAGE, html)
+    next_page = int(keys[0]) if keys else 0
+    pages = [int(p) for p in re.findall(re.compile(r'data-link-name="pager"[^>]*?href="[^"]*?[?&;]page=([0-9]+)"'), html)]
+    return {'current_page': current_page, 'next_page': next_page, 'last_page': max(pages) if pages else 0}
+
+
+def legacy_parse_listing(html, url):
+    """原 FC2GatherCore 的解析方式：每项单独编译正则并各自扫描全文"""
+    page_type = 'list_unknown' if 'c-cntCard-110-f' in html else 'unknown'
+    if re.search(r'^/users/[^/]+/articles', url):
+        page_type = 'user_articles'
+    return dict(legacy_pager(html), page_type=page_type, ids=legacy_listing_ids(html))
+
+
+def timed(func, html, url, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(html, url)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='列表页解析基准')
+    parser.add_argument('--cards', type=int, default=60, help='每页作品数')
+    parser.add_argument('--pages', type=int, default=50, help='分页链接数')
+    parser.add_argument('--filler', type=int, default=800, help='页面头部/尾部填充长度（控制页面大小）')
+    parser.add_argument('--repeat', type=int, default=200, help='重复次数')
+    parser.add_argument('--spans', type=int, default=2000, help='分页异常页面中的 span 数')
+    args = parser.parse_args()
+
+    html = build_listing_page(args.cards, args.pages, filler=args.filler)
+    url = '/users/example/articles'
+    print(f"页面大小 {len(html) / 1024:.0f}KB，作品 {args.cards} 个，分页链接 {args.pages - 1} 个")
+    before, old = timed(lambda h, u: legacy_listing_ids(h), html, url, args.repeat)
+    after, new = timed(lambda h, u: fc2_parser.listing_ids(h), html, url, args.repeat)
+    print(f"番号提取  原卡片正则: {before * 1000:.3f} ms/页  listing_ids: {after * 1000:.3f} ms/页  "
+          f"番号 {len(old)}/{len(new)}  加速比 {before / after:.2f}x")
+    before, old = timed(lambda h, u: legacy_pager(h), html, url, args.repeat)
+    after, new = timed(lambda h, u: fc2_parser.parse_pager(h), html, url, args.repeat)
+    print(f"分页解析  原分页正则: {before * 1000:.3f} ms/页  parse_pager: {after * 1000:.3f} ms/页  "
+          f"下一页 {old['next_page']}/{new['next_page']}  加速比 {before / after:.2f}x")
+
+    before, old = timed(legacy_parse_listing, html, url, args.repeat)
+    after, new = timed(fc2_parser.parse_listing, html, url, args.repeat)
+    print(f"原解析方式: {before * 1000:.3f} ms/页  番号 {len(old['ids'])}，当前页 {old['current_page']}，"
+          f"下一页 {old['next_page']}，末页 {old['last_page']}")
+    print(f"fc2_parser: {after * 1000:.3f} ms/页  番号 {len(new['ids'])}，当前页 {new['current_page']}，"
+          f"下一页 {new['next_page']}，末页 {new['last_page']}")
+    print(f"整页加速比: {before / after:.2f}x")
+
+    html = build_malformed_page(args.spans)
+    print(f"\n分页异常页面 {len(html) / 1024:.0f}KB")
+    start = time.perf_counter()
+    keys = LEGACY_NEXT_PAGE.findall(html)
+    before = time.perf_counter() - start
+    after, pager = timed(lambda h, u: fc2_parser.parse_pager(h), html, url, args.repeat)
+    print(f"原下一页正则: {before * 1000:.1f} ms  下一页 {int(keys[0]) if keys else 0}")
+    print(f"parse_pager:  {after * 1000:.3f} ms  下一页 {pager['next_page']}，末页 {pager['last_page']}")
+
+
+if __name__ == '__main__':
+    main()
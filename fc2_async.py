@@ -0,0 +1,313 @@
+# -*- coding:utf-8 -*-
+"""
+FC2资源收集器 - 异步 HTTP 客户端
+基于 asyncio 流（标准库），在一个线程的事件循环里同时进行大量请求：每个进行中的请求只占用一个协程与一条连接。
+支持 http/https、HTTP 代理（https 经 CONNECT 隧道）、按站点复用连接、gzip/deflate 与分块传输，
+流式读取时读到停止条件即关闭连接；与同步会话共用限速器、请求指标与 HTTP 存档。
+不支持 PAC 与 SOCKS 代理，这两种情况由调用方改用线程方式。
+"""
+
+import asyncio
+import base64
+import codecs
+import ssl
+import time
+import zlib
+from urllib.parse import urlsplit
+
+import requests
+
+import fc2_parser
+from fc2_core import ARCHIVE_RECORD, ARCHIVE_REPLAY, site_of
+
+# 自动重试的状态码（与同步会话的 urllib3 重试策略一致）
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# 每次读取的字节数，与同步会话流式读取的块大小相同
+READ_SIZE = 16 * 1024
+# 由客户端自行设置的请求头，调用方传入的同名请求头被忽略
+OWN_HEADERS = ('host', 'accept-encoding', 'connection', 'proxy-authorization')
+
+
+class ProtocolError(ConnectionError):
+    """响应格式错误或代理隧道建立失败"""
+
+
+class AsyncHttpClient:
+    """
+    异步 GET 客户端。get() 返回 (状态码, 文本)，非 200 时文本为 None；
+    连接错误、超时与 429/5xx 按 attempts 次数退避重试，用尽后抛出最后一次的异常或返回最后的状态码。
+    """
+
+    def __init__(self, proxy='', verify_ssl=True, timeout=15, attempts=3,
+                 rate_limiter=None, metrics=None, archive=None):
+        if not self.supports_proxy(proxy):
+            raise ValueError('异步客户端只支持 HTTP 代理：' + str(proxy))
+        self.proxy = urlsplit(proxy) if proxy else None
+        self.timeout = timeout
+        self.attempts = max(1, int(attempts))
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
+        self.archive = archive
+        self._ssl = ssl.create_default_context()
+        if not verify_ssl:
+            self._ssl.check_hostname = False
+            self._ssl.verify_mode = ssl.CERT_NONE
+        # 空闲连接：{(协议, 主机, 端口): [(reader, writer)]}
+        self._idle = {}
+
+    @staticmethod
+    def supports_proxy(proxy):
+        """是否支持该代理地址（空为直连，只支持 http:// 代理）"""
+        return not proxy or str(proxy).lower().startswith('http://')
+
+    async def get(self, url, headers=None, stop=None):
+        """GET 一个页面；stop 为正则时读到 stop 即停止下载剩余内容（录制存档时读取完整响应）"""
+        # 与 requests 会话相同的 URL 规范化（百分号编码），存档也按此 URL 存取
+        url = requests.Request('GET', url).prepare().url
+        if self.archive is not None and self.archive.mode == ARCHIVE_REPLAY:
+            return self._replay(url)
+        if self.archive is not None and self.archive.mode == ARCHIVE_RECORD:
+            stop = None
+        site = site_of(url)
+        for i in range(self.attempts):
+            if self.rate_limiter is not None:
+                delay = self.rate_limiter.reserve(url)
+                self._add(site, 'throttle_seconds', delay)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            started = time.perf_counter()
+            try:
+                status, reason, response_headers, text, size = await self._exchange(url, headers or {}, stop)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, zlib.error) as e:
+                self._add(site, 'requests')
+                self._add(site, 'errors', key=type(e).__name__)
+                if i == self.attempts - 1:
+                    raise
+                self._add(site, 'retries')
+                await asyncio.sleep(self.backoff(i))
+                continue
+            if self.metrics is not None:
+                self.metrics.observe(site, time.perf_counter() - started)
+            self._add(site, 'requests')
+            self._add(site, 'status', key=status)
+            self._add(site, 'bytes', size)
+            if self.archive is not None and text is not None:
+                self._record(url, status, reason, response_headers, text)
+            if status in RETRY_STATUS and i < self.attempts - 1:
+                self._add(site, 'retries')
+                await asyncio.sleep(self.backoff(i, response_headers.get('retry-after')))
+                continue
+            return status, text if status == 200 else None
+
+    @staticmethod
+    def backoff(attempt, retry_after=None):
+        """第 attempt 次失败后的等待秒数：优先使用 Retry-After，否则指数退避（最多 5 秒）"""
+        try:
+            return max(0.0, float(retry_after))
+        except (TypeError, ValueError):
+            return min(0.5 * 2 ** attempt, 5)
+
+    async def close(self):
+        """关闭所有空闲连接"""
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for _, writer in connections:
+                await self._close(writer)
+
+    async def _exchange(self, url, headers, stop):
+        """发送一次请求并读取响应，返回 (状态码, 原因, 响应头, 文本, 传输字节数)；非 200 时文本为 None"""
+        parts = urlsplit(url)
+        https = parts.scheme == 'https'
+        port = parts.port or (443 if https else 80)
+        key = (parts.scheme, parts.hostname, port)
+        host = parts.hostname if port == (443 if https else 80) else f'{parts.hostname}:{port}'
+        target = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        if self.proxy is not None and not https:
+            target = url
+        lines = [f'GET {target} HTTP/1.1', f'Host: {host}', 'Accept-Encoding: gzip, deflate', 'Connection: keep-alive']
+        lines += [f'{k}: {v}' for k, v in headers.items() if k.lower() not in OWN_HEADERS]
+        if self.proxy is not None and not https and self.proxy.username:
+            lines.append('Proxy-Authorization: ' + self._proxy_auth())
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        while True:
+            connections = self._idle.get(key)
+            reused = bool(connections)
+            reader, writer = connections.pop() if reused else await self._open(parts.scheme, parts.hostname, port)
+            try:
+                writer.write(request)
+                await writer.drain()
+                status_line = await self._timed(reader.readline())
+            except (OSError, asyncio.TimeoutError):
+                await self._close(writer)
+                if reused:
+                    continue
+                raise
+            if not status_line and reused:
+                # 复用的空闲连接已被服务器关闭，换一条新连接重发
+                await self._close(writer)
+                continue
+            break
+        try:
+            version, status, reason = self._status(status_line)
+            response_headers = await self._headers(reader)
+            if status != 200 and self.archive is None:
+                await self._close(writer)
+                return status, reason, response_headers, None, 0
+            text, size, complete = await self._body(reader, response_headers, stop)
+        except BaseException:
+            await self._close(writer)
+            raise
+        keep_alive = complete and version == 'HTTP/1.1' and response_headers.get('connection', '').lower() != 'close'
+        if keep_alive:
+            self._idle.setdefault(key, []).append((reader, writer))
+        else:
+            await self._close(writer)
+        return status, reason, response_headers, text, size
+
+    async def _open(self, scheme, host, port):
+        """建立连接（经 HTTP 代理时 https 先用 CONNECT 建立隧道）"""
+        context = self._ssl if scheme == 'https' else None
+        if self.proxy is None:
+            return await self._timed(asyncio.open_connection(
+                host, port, ssl=context, server_hostname=host if context else None))
+        reader, writer = await self._timed(asyncio.open_connection(self.proxy.hostname, self.proxy.port or 80))
+        if context is None:
+            return reader, writer
+        try:
+            lines = [f'CONNECT {host}:{port} HTTP/1.1', f'Host: {host}:{port}']
+            if self.proxy.username:
+                lines.append('Proxy-Authorization: ' + self._proxy_auth())
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+            await writer.drain()
+            _, status, reason = self._status(await self._timed(reader.readline()))
+            await self._headers(reader)
+            if status != 200:
+                raise ProtocolError(f'代理隧道建立失败：{status} {reason}')
+            await self._timed(writer.start_tls(context, server_hostname=host))
+        except BaseException:
+            await self._close(writer)
+            raise
+        return reader, writer
+
+    async def _body(self, reader, headers, stop):
+        """读取响应体并解码为文本，返回 (文本, 传输字节数, 是否读完)；读到 stop 后停止"""
+        encoding = headers.get('content-encoding', '').lower()
+        inflate = zlib.decompressobj(16 + zlib.MAX_WBITS) if encoding == 'gzip' else \
+            zlib.decompressobj() if encoding == 'deflate' else None
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        scanner = fc2_parser.StreamScanner(stop) if stop is not None else None
+        parts = []
+        size = 0
+        complete = False
+        async for data in self._raw_body(reader, headers):
+            if data is None:
+                complete = True
+                break
+            size += len(data)
+            chunk = decoder.decode(inflate.decompress(data) if inflate is not None else data)
+            if scanner is not None:
+                if scanner.feed(chunk):
+                    return scanner.text, size, False
+            else:
+                parts.append(chunk)
+        tail = decoder.decode(inflate.flush() if inflate is not None else b'', final=True)
+        if scanner is not None:
+            scanner.feed(tail)
+            return scanner.text, size, complete
+        parts.append(tail)
+        return ''.join(parts), size, complete
+
+    async def _raw_body(self, reader, headers):
+        """按传输方式（分块 / Content-Length / 读到连接关闭）逐块产出原始响应体，读完后产出 None"""
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            while True:
+                line = await self._timed(reader.readline())
+                try:
+                    length = int(line.split(b';', 1)[0].strip(), 16)
+                except ValueError:
+                    raise ProtocolError('分块长度格式错误：' + repr(line[:40]))
+                if length == 0:
+                    await self._headers(reader)
+                    yield None
+                    return
+                yield await self._timed(reader.readexactly(length))
+                await self._timed(reader.readexactly(2))
+        elif 'content-length' in headers:
+            remaining = int(headers['content-length'])
+            while remaining > 0:
+                data = await self._timed(reader.read(min(remaining, READ_SIZE)))
+                if not data:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                remaining -= len(data)
+                yield data
+            yield None
+        else:
+            while True:
+                data = await self._timed(reader.read(READ_SIZE))
+                if not data:
+                    return
+                yield data
+
+    async def _headers(self, reader):
+        """读取响应头（直到空行），返回小写键的字典"""
+        headers = {}
+        while True:
+            line = await self._timed(reader.readline())
+            if line in (b'\r\n', b'\n'):
+                return headers
+            if not line:
+                raise asyncio.IncompleteReadError(b'', None)
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            value = value.strip()
+            headers[name] = headers[name] + ', ' + value if name in headers else value
+
+    @staticmethod
+    def _status(line):
+        """解析状态行，返回 (版本, 状态码, 原因)"""
+        try:
+            version, status, *reason = line.decode('latin-1').split(None, 2)
+            return version, int(status), reason[0].strip() if reason else ''
+        except ValueError:
+            raise ProtocolError('无效的状态行：' + repr(line[:80]))
+
+    def _proxy_auth(self):
+        credentials = f'{self.proxy.username}:{self.proxy.password or ""}'.encode('utf-8')
+        return 'Basic ' + base64.b64encode(credentials).decode('ascii')
+
+    async def _timed(self, awaitable):
+        """单次连接/读取操作的超时（与同步会话的 timeout 含义相同）"""
+        return await asyncio.wait_for(awaitable, self.timeout)
+
+    @staticmethod
+    async def _close(writer):
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+    def _add(self, site, field, value=1, key=None):
+        if self.metrics is not None:
+            self.metrics.add(site, field, value, key=key)
+
+    def _replay(self, url):
+        """回放模式：由存档构造响应，不访问网络也不限速"""
+        response = self.archive.replay(requests.Request('GET', url).prepare())
+        site = site_of(url)
+        self._add(site, 'requests')
+        self._add(site, 'status', key=response.status_code)
+        if response.status_code != 200:
+            return response.status_code, None
+        response.encoding = 'utf-8'
+        return 200, response.text
+
+    def _record(self, url, status, reason, headers, text):
+        """录制模式：把已读取的完整响应写入存档（响应体为解压后的内容）"""
+        response = requests.models.Response()
+        response.url = url
+        response.status_code = status
+        response.reason = reason
+        response.headers = requests.structures.CaseInsensitiveDict(headers)
+        response._content = text.encode('utf-8')
+        self.archive.record(requests.Request('GET', url).prepare(), response)
@@ -9,10 +9,18 @@ import os
 import sys
 import time
 import re
+import sqlite3
 import threading
+import atexit
+import json
+import queue
+import zlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from configparser import RawConfigParser
 from traceback import format_exc
 from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 try:
     from pypac import PACSession
@@ -21,26 +29,1219 @@ except Exception:
 
 import urllib3
 from urllib3.util.retry import Retry
-from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse, quote_plus
+
+import fc2_parser
+
+
+# 已知站点：限速等按站点区分
+SITE_HOSTS = {
+    'adult.contents.fc2.com': 'fc2',
+    'sukebei.nyaa.si': 'sukebei',
+}
+
+# 各站点地址，可通过 FC2_base_url / Sukebei_base_url 指向本地模拟服务器（fc2_stub_server.py）
+DEFAULT_BASE_URLS = {
+    'fc2': 'https://adult.contents.fc2.com',
+    'sukebei': 'https://sukebei.nyaa.si',
+}
+BASE_URL_KEYS = {
+    'fc2': 'FC2_base_url',
+    'sukebei': 'Sukebei_base_url',
+}
+
+# 各站点默认限速：(每秒请求数, 突发请求数)
+DEFAULT_RATE_LIMITS = {
+    'fc2': (2.0, 4),
+    'sukebei': (2.0, 4),
+}
+
+# 各站点响应缓存默认有效期（小时）：作品页很少变化，搜索结果变化较快
+DEFAULT_CACHE_HOURS = {
+    'fc2': 168,
+    'sukebei': 12,
+}
+
+
+def site_of(url):
+    """根据URL判断所属站点，已知站点（含登记的自定义地址）返回 fc2/sukebei，其余返回主机名"""
+    try:
+        parsed = urlparse(url)
+        netloc = parsed.netloc.lower()
+        host = (parsed.hostname or '').lower()
+    except Exception:
+        netloc = host = ''
+    return SITE_HOSTS.get(netloc) or SITE_HOSTS.get(host, host)
+
+
+def register_site(site, base_url):
+    """登记站点的自定义地址（主机:端口），限速、缓存有效期等按站点的设置对其生效"""
+    netloc = urlparse(base_url).netloc.lower()
+    if netloc:
+        SITE_HOSTS[netloc] = site
+
+
+def base_url_from_config(config, site, section='下载设置'):
+    """站点地址（FC2_base_url / Sukebei_base_url），未配置时为正式站点；自定义地址会登记为该站点"""
+    try:
+        base = str(config.get(section, BASE_URL_KEYS[site])).strip().rstrip('/')
+    except Exception:
+        base = ''
+    if not base:
+        return DEFAULT_BASE_URLS[site]
+    register_site(site, base)
+    return base
+
+
+def rebase_url(url, site, base_url):
+    """把该站点正式地址下的URL改为 base_url 下的同一路径，其他URL原样返回"""
+    default = DEFAULT_BASE_URLS[site]
+    if base_url != default and url.startswith(default):
+        return base_url + url[len(default):]
+    return url
+
+
+class HostRateLimiter:
+    """按站点的令牌桶限速器，所有请求路径与线程共享"""
+
+    def __init__(self, limits=None):
+        # limits: {站点: (每秒请求数, 突发请求数)}；未配置或速率<=0 的站点不限速
+        self.limits = dict(limits or {})
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, section='下载设置'):
+        """从 config.ini 读取 Rate_fc2/Burst_fc2/Rate_sukebei/Burst_sukebei"""
+        limits = {}
+        for site, (rate, burst) in DEFAULT_RATE_LIMITS.items():
+            try:
+                rate = float(config.get(section, f'Rate_{site}'))
+            except Exception:
+                pass
+            try:
+                burst = int(config.get(section, f'Burst_{site}'))
+            except Exception:
+                pass
+            limits[site] = (rate, max(1, burst))
+        return cls(limits)
+
+    def reserve(self, url):
+        """
+        预约一个令牌但不等待，返回距可发送时刻的秒数。
+        令牌允许透支，排队的调用方按预约先后依次放行；异步调用方据此 await asyncio.sleep。
+        """
+        site = site_of(url)
+        rate, burst = self.limits.get(site, (0, 1))
+        if rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(site, (float(burst), now))
+            tokens = min(float(burst), tokens + (now - last) * rate) - 1
+            self._buckets[site] = (tokens, now)
+        return -tokens / rate if tokens < 0 else 0.0
+
+    def acquire(self, url, stop_event=None):
+        """预约一个令牌，必要时等待到可发送时刻，返回实际等待秒数"""
+        delay = self.reserve(url)
+        if delay > 0:
+            if stop_event is not None:
+                stop_event.wait(delay)
+            else:
+                time.sleep(delay)
+        return delay
+
+
+# 页面获取结果：unchanged 表示内容与缓存一致（有效期内命中或 304），可复用缓存的解析结果
+FetchResult = namedtuple('FetchResult', ['text', 'unchanged'])
+
+# 标题获取方式：完整（先下载作品页取标题）/ 仅磁力（不取标题）/ 延迟（使用 sukebei 结果标题，之后按需补全）
+TITLE_FULL = '完整'
+TITLE_MAGNET_ONLY = '仅磁力'
+TITLE_LAZY = '延迟'
+TITLE_MODES = (TITLE_FULL, TITLE_MAGNET_ONLY, TITLE_LAZY)
+
+# 结果状态
+STATUS_LISTED = 'listed'        # 已从卖家页面收集，尚未搜索磁力
+STATUS_FOUND = 'found'          # 已找到磁力
+STATUS_NO_MAGNET = 'no_magnet'  # 搜索成功但无磁力
+STATUS_ERROR = 'error'          # 网络等原因搜索失败
+
+
+def store_key(text):
+    """将番号文本（FC2-PPV-123456 / FC2 123456 / 123456）归一化为结果库主键"""
+    s = str(text or '').strip()
+    m = re.search(r'(\d{5,})', s)
+    return m.group(1) if m else s
+
+
+class BatchWriter:
+    """
+    后台批量写入：工作线程只把记录放入队列，由单一写入线程按数量（max_items）
+    或时间（max_delay 秒）阈值成批交给 sink 写出；flush() 等待已提交的记录写完，
+    close() 及进程退出时写出剩余记录。
+    """
+
+    _FLUSH = object()
+    _END = object()
+
+    def __init__(self, sink, max_items=500, max_delay=1.0):
+        self.sink = sink
+        self.max_items = max(1, max_items)
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, item):
+        """提交一条记录（不阻塞）"""
+        self._queue.put(item)
+
+    def flush(self):
+        """立即写出并等待此前提交的全部记录写完"""
+        if self._closed:
+            return
+        self._queue.put(self._FLUSH)
+        self._queue.join()
+
+    def close(self):
+        """写出剩余记录并结束写入线程（可重复调用）"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(self._END)
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        batch = []
+        taken = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                item = self._queue.get(timeout=timeout)
+                taken += 1
+            except queue.Empty:
+                item = self._FLUSH
+            if item is not self._FLUSH and item is not self._END:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.time() + self.max_delay
+                if len(batch) < self.max_items:
+                    continue
+            if batch:
+                try:
+                    self.sink(batch)
+                except Exception:
+                    sys.stderr.write(format_exc())
+                batch = []
+            deadline = None
+            for _ in range(taken):
+                self._queue.task_done()
+            taken = 0
+            if item is self._END:
+                return
+
+
+class ResultStore:
+    """
+    番号结果库（SQLite，WAL 模式），保存番号、标题、磁力、状态与获取时间。
+    结果经 BatchWriter 由后台线程按数量/时间阈值在单个事务中批量提交；txt 文件由 export_txt 导出生成。
+    """
+
+    FILENAME = 'fc2_gather.db'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS items (
+            fc2_id     TEXT PRIMARY KEY,
+            title      TEXT NOT NULL DEFAULT '',
+            url        TEXT NOT NULL DEFAULT '',
+            status     TEXT NOT NULL,
+            fetched_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_items_status ON items(status);
+        CREATE TABLE IF NOT EXISTS magnets (
+            fc2_id   TEXT NOT NULL,
+            magnet   TEXT NOT NULL,
+            position INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (fc2_id, magnet)
+        );
+        CREATE TABLE IF NOT EXISTS listings (
+            source  TEXT NOT NULL,
+            fc2_id  TEXT NOT NULL,
+            seen_at TEXT,
+            PRIMARY KEY (source, fc2_id)
+        );
+        CREATE TABLE IF NOT EXISTS listing_sources (
+            source       TEXT PRIMARY KEY,
+            completed_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS torrents (
+            infohash   TEXT PRIMARY KEY,
+            fc2_id     TEXT NOT NULL,
+            emitted_at TEXT
+        );
+    """
+
+    def __init__(self, path, batch_size=100, flush_interval=2.0):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+        self._conn.commit()
+        self._writer = BatchWriter(self._write_rows, batch_size, flush_interval)
+
+    @classmethod
+    def open_in(cls, download_path, **kwargs):
+        """在下载目录下打开（或创建）结果库"""
+        os.makedirs(download_path, exist_ok=True)
+        return cls(os.path.join(download_path, cls.FILENAME), **kwargs)
+
+    def record(self, fc2_id, status, title='', url='', magnets=None):
+        """提交一条结果到写入队列（不阻塞），由写入线程批量提交"""
+        row = (store_key(fc2_id), title or '', url or '', status,
+               datetime.now().isoformat(timespec='seconds'), list(magnets or []))
+        self._writer.put(row)
+
+    def mark_listed(self, fc2_ids):
+        """登记收集到的番号（已存在的记录保持原状态）"""
+        now = datetime.now().isoformat(timespec='seconds')
+        self.flush()
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO items (fc2_id, status, fetched_at) VALUES (?, ?, ?)',
+                    [(store_key(i), STATUS_LISTED, now) for i in fc2_ids],
+                )
+
+    def known_listing_ids(self, source):
+        """某个卖家列表页（source）以往收集到的番号集合"""
+        with self._lock:
+            rows = self._conn.execute('SELECT fc2_id FROM listings WHERE source = ?', (source,)).fetchall()
+        return {row[0] for row in rows}
+
+    def add_listing_ids(self, source, fc2_ids):
+        """
+        记录一次完整抓取（未中断、无失败页）收集到的番号，并把该列表页标记为已有完整记录，
+        供增量抓取判断；抓取不完整时不应调用，否则增量抓取会在首页停止，漏掉从未获取过的旧页面
+        """
+        now = datetime.now().isoformat(timespec='seconds')
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO listings (source, fc2_id, seen_at) VALUES (?, ?, ?)',
+                    [(source, store_key(i), now) for i in fc2_ids],
+                )
+                self._conn.execute(
+                    'INSERT OR IGNORE INTO listing_sources (source, completed_at) VALUES (?, ?)', (source, now)
+                )
+
+    def listing_complete(self, source):
+        """该卖家列表页是否已有一次完整抓取的记录"""
+        with self._lock:
+            row = self._conn.execute('SELECT 1 FROM listing_sources WHERE source = ?', (source,)).fetchone()
+        return row is not None
+
+    def ids_without_title(self):
+        """已搜索过磁力但缺少标题的番号"""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT fc2_id FROM items WHERE title = '' AND status IN (?, ?) ORDER BY fc2_id",
+                (STATUS_FOUND, STATUS_NO_MAGNET),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def update_titles(self, titles):
+        """仅更新标题，不改变状态与磁力：titles 为 {番号: 标题}"""
+        self.flush()
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    'UPDATE items SET title = ? WHERE fc2_id = ?',
+                    [(title, store_key(fc2_id)) for fc2_id, title in titles.items()],
+                )
+
+    def flush(self):
+        """等待写入队列中的全部结果提交"""
+        self._writer.flush()
+
+    def _write_rows(self, rows):
+        """写入线程：在单个事务中提交一批结果"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO items (fc2_id, title, url, status, fetched_at) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(fc2_id) DO UPDATE SET '
+                "title = CASE WHEN excluded.title != '' THEN excluded.title ELSE items.title END, "
+                "url = CASE WHEN excluded.url != '' THEN excluded.url ELSE items.url END, "
+                'status = excluded.status, fetched_at = excluded.fetched_at',
+                [row[:5] for row in rows],
+            )
+            # 每个写入的番号都先清除旧磁力，状态改为无磁力/失败时不残留以往的磁力
+            self._conn.executemany('DELETE FROM magnets WHERE fc2_id = ?', [(row[0],) for row in rows])
+            found = [row for row in rows if row[3] == STATUS_FOUND]
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO magnets (fc2_id, magnet, position) VALUES (?, ?, ?)',
+                [(row[0], magnet, pos) for row in found for pos, magnet in enumerate(row[5])],
+            )
+
+    def _query_ids(self, sql, fc2_ids, *params):
+        """以 JSON 数组一次性传入番号集合执行查询（首个参数为番号集合）"""
+        keys = json.dumps([store_key(i) for i in fc2_ids])
+        self.flush()
+        with self._lock:
+            return self._conn.execute(sql, (keys,) + params).fetchall()
+
+    def ids_with_magnet(self, fc2_ids):
+        """返回给定番号中已有磁力的番号集合（单次索引查询）"""
+        rows = self._query_ids(
+            'SELECT fc2_id FROM items WHERE fc2_id IN (SELECT value FROM json_each(?)) AND status = ?',
+            fc2_ids, STATUS_FOUND,
+        )
+        return {row[0] for row in rows}
+
+    def get_items(self, fc2_ids):
+        """按番号读取结果：{番号: {'status','title','url','magnets','fetched_at'}}"""
+        rows = self._query_ids(
+            'SELECT i.fc2_id, i.status, i.title, i.url, i.fetched_at, m.magnet FROM items i '
+            'LEFT JOIN magnets m ON m.fc2_id = i.fc2_id '
+            'WHERE i.fc2_id IN (SELECT value FROM json_each(?)) ORDER BY i.fc2_id, m.position',
+            fc2_ids,
+        )
+        items = {}
+        for fc2_id, status, title, url, fetched_at, magnet in rows:
+            item = items.setdefault(fc2_id, {
+                'status': status, 'title': title, 'url': url,
+                'fetched_at': fetched_at, 'magnets': [],
+            })
+            if magnet:
+                item['magnets'].append(magnet)
+        return items
+
+    def unemitted_magnets(self, entries):
+        """
+        信息哈希去重索引（跨批次持久保存）：entries 为按输出顺序排列的 (番号, 磁力)，
+        返回其中从未输出过的条目（同一种子只保留第一个）。只查询不登记，文件写出成功后再调用 mark_emitted。
+        同一种子的不同磁力写法（tracker、dn 不同）按信息哈希视为同一个；无法识别哈希的磁力按原文去重。
+        """
+        keyed = []
+        seen = set()
+        for fc2_id, magnet in entries:
+            key = fc2_parser.infohash_of(magnet) or magnet
+            if key not in seen:
+                seen.add(key)
+                keyed.append((key, fc2_id, magnet))
+        with self._lock:
+            emitted = {row[0] for row in self._conn.execute(
+                'SELECT infohash FROM torrents WHERE infohash IN (SELECT value FROM json_each(?))',
+                (json.dumps([key for key, _, _ in keyed]),),
+            )}
+        return [(fc2_id, magnet) for key, fc2_id, magnet in keyed if key not in emitted]
+
+    def mark_emitted(self, entries):
+        """把已写入文件的 (番号, 磁力) 登记为已输出，之后的批次不再输出同一种子"""
+        now = datetime.now().isoformat(timespec='seconds')
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO torrents (infohash, fc2_id, emitted_at) VALUES (?, ?, ?)',
+                    [(fc2_parser.infohash_of(magnet) or magnet, store_key(fc2_id), now) for fc2_id, magnet in entries],
+                )
+
+    def export_txt(self, download_path, entries, dedupe=False):
+        """
+        按 entries（番号原文，保持顺序）导出 magnet.txt / no_magnet.txt / error.txt。
+        dedupe=True 时 magnet.txt 只写入以往从未输出过的种子（见 unemitted_magnets），文件写出成功后才登记为已输出。
+        返回 {状态: 数量}，另含 'duplicates'：因去重未写入的磁力数。
+        """
+        labels = [str(e).strip() for e in entries if str(e).strip()]
+        items = self.get_items(labels)
+        counts = {STATUS_FOUND: 0, STATUS_NO_MAGNET: 0, STATUS_ERROR: 0}
+        emit = None
+        if dedupe:
+            found = [(label, m) for label in labels
+                     for m in (items.get(store_key(label)) or {}).get('magnets', [])]
+            kept = self.unemitted_magnets(found)
+            counts['duplicates'] = len(found) - len(kept)
+            emit = {}
+            for label, magnet in kept:
+                emit.setdefault(label, []).append(magnet)
+        with open(os.path.join(download_path, 'magnet.txt'), 'w', encoding='UTF-8') as f_magnet, \
+                open(os.path.join(download_path, 'no_magnet.txt'), 'w', encoding='UTF-8') as f_none, \
+                open(os.path.join(download_path, 'error.txt'), 'w', encoding='UTF-8') as f_error:
+            for label in labels:
+                item = items.get(store_key(label))
+                status = item['status'] if item else None
+                if status == STATUS_FOUND:
+                    magnets = item['magnets'] if emit is None else emit.pop(label, [])
+                    f_magnet.writelines(m + '\n' for m in magnets)
+                elif status == STATUS_NO_MAGNET:
+                    f_none.write(label + '\n')
+                elif status == STATUS_ERROR:
+                    f_error.write(label + '--连接失败\n')
+                else:
+                    continue
+                counts[status] += 1
+        if dedupe:
+            self.mark_emitted(kept)
+        return counts
+
+    def close(self):
+        """提交剩余结果并关闭数据库"""
+        self._writer.close()
+        with self._lock:
+            self._conn.close()
+
+
+class CheckpointJournal:
+    """
+    断点续传日志（JSON Lines）：每完成一个番号追加一行，由写入线程至多 FLUSH_DELAY 秒刷盘一次，
+    进程中断后可据此跳过已完成的番号（最后不足一秒的记录会重新处理）；整批完成后删除。
+    """
+
+    FILENAME = 'checkpoint.jsonl'
+
+    # 视为“已解决”的状态，续传时跳过；失败的番号会重新处理
+    RESOLVED = (STATUS_FOUND, STATUS_NO_MAGNET)
+
+    FLUSH_DELAY = 1.0
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._writer = None
+
+    @classmethod
+    def open_in(cls, download_path):
+        """使用下载目录下的断点日志"""
+        os.makedirs(download_path, exist_ok=True)
+        return cls(os.path.join(download_path, cls.FILENAME))
+
+    def load(self):
+        """读取已完成的记录：{番号: 记录}，忽略中断时写了一半的行"""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    records[store_key(record['id'])] = record
+                except Exception:
+                    continue
+        return records
+
+    def resolved(self):
+        """已解决（找到磁力或确认无磁力）的记录"""
+        return {k: r for k, r in self.load().items() if r.get('status') in self.RESOLVED}
+
+    def append(self, fc2_id, status, title='', url='', magnets=None):
+        """追加一条完成记录（写入线程批量落盘）"""
+        record = {
+            'id': fc2_id, 'status': status, 'title': title or '',
+            'url': url or '', 'magnets': list(magnets or []),
+        }
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._writer is None:
+                self._writer = BatchWriter(self._write_lines, max_delay=self.FLUSH_DELAY)
+            self._writer.put(line)
+
+    def _write_lines(self, lines):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+
+    def close(self):
+        """写出剩余记录并关闭日志（保留内容供下次续传）"""
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def clear(self):
+        """删除日志（开始新批次或整批完成时调用）"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class ResponseCache:
+    """
+    磁盘响应缓存（SQLite）：按 URL 保存压缩后的页面内容及 ETag/Last-Modified 校验信息，
+    按站点设置有效期，总大小超过上限时淘汰最久未访问的条目（LRU）。
+    过期条目可通过条件请求重新验证，304 时继续使用缓存内容及其解析结果。
+    """
+
+    FILENAME = 'http_cache.db'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            url           TEXT PRIMARY KEY,
+            site          TEXT NOT NULL,
+            body          BLOB NOT NULL,
+            size          INTEGER NOT NULL,
+            stored_at     REAL NOT NULL,
+            accessed_at   REAL NOT NULL,
+            etag          TEXT,
+            last_modified TEXT,
+            parsed        TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at);
+    """
+
+    def __init__(self, path, ttl_hours=None, max_bytes=200 * 1024 * 1024):
+        self.path = path
+        self.ttl_hours = dict(DEFAULT_CACHE_HOURS if ttl_hours is None else ttl_hours)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+        # 兼容旧版本缓存库：补齐校验信息与解析结果列
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(responses)')}
+        for column in ('etag', 'last_modified', 'parsed'):
+            if column not in columns:
+                self._conn.execute(f'ALTER TABLE responses ADD COLUMN {column} TEXT')
+        self._conn.commit()
+        self._total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        self.reset_stats()
+
+    @classmethod
+    def from_config(cls, config, download_path, section='下载设置'):
+        """读取 Cache_hours_fc2/Cache_hours_sukebei/Cache_size_mb，在下载目录下打开缓存"""
+        os.makedirs(download_path, exist_ok=True)
+        return cls(cls.path_in(download_path), *cls.limits_from_config(config, section))
+
+    @classmethod
+    def path_in(cls, download_path):
+        """下载目录下的缓存文件路径"""
+        return os.path.join(download_path, cls.FILENAME)
+
+    @staticmethod
+    def limits_from_config(config, section='下载设置'):
+        """读取各站点有效期（小时）与大小上限（字节）：(ttl_hours, max_bytes)"""
+        ttl_hours = {}
+        for site, hours in DEFAULT_CACHE_HOURS.items():
+            try:
+                hours = float(config.get(section, f'Cache_hours_{site}'))
+            except Exception:
+                pass
+            ttl_hours[site] = hours
+        try:
+            size_mb = float(config.get(section, 'Cache_size_mb'))
+        except Exception:
+            size_mb = 200
+        return ttl_hours, int(size_mb * 1024 * 1024)
+
+    def reset_stats(self):
+        """清零命中统计"""
+        self.stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stores': 0, 'evictions': 0, 'bytes_saved': 0}
+
+    def snapshot(self):
+        """当前累计的命中统计（副本），传给 summary() 即得到此后的统计"""
+        with self._lock:
+            return dict(self.stats)
+
+    def ttl_seconds(self, url):
+        """该URL所属站点的缓存有效期（秒），未配置的站点不缓存"""
+        return self.ttl_hours.get(site_of(url), 0) * 3600
+
+    def lookup(self, url, max_age=None):
+        """
+        查找缓存条目：{'text', 'fresh', 'etag', 'last_modified'}，不存在返回 None。
+        fresh 表示仍在有效期内可直接使用，否则应携带校验信息发起条件请求。
+        max_age 缺省为站点有效期。
+        """
+        if max_age is None:
+            max_age = self.ttl_seconds(url)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT body, stored_at, etag, last_modified FROM responses WHERE url = ?', (url,)
+            ).fetchone()
+            fresh = row is not None and max_age > 0 and now - row[1] <= max_age
+            if fresh:
+                with self._conn:
+                    self._conn.execute('UPDATE responses SET accessed_at = ? WHERE url = ?', (now, url))
+                self.stats['hits'] += 1
+            else:
+                self.stats['misses'] += 1
+        if row is None:
+            return None
+        text = zlib.decompress(row[0]).decode('utf-8')
+        if fresh:
+            self.stats['bytes_saved'] += len(row[0])
+        return {'text': text, 'fresh': fresh, 'etag': row[2], 'last_modified': row[3]}
+
+    def mark_not_modified(self, url):
+        """条件请求返回 304：刷新条目时间，内容与解析结果保持不变"""
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                row = self._conn.execute('SELECT size FROM responses WHERE url = ?', (url,)).fetchone()
+                self._conn.execute(
+                    'UPDATE responses SET stored_at = ?, accessed_at = ? WHERE url = ?', (now, now, url)
+                )
+            self.stats['revalidated'] += 1
+            if row:
+                self.stats['bytes_saved'] += row[0]
+
+    def get_parsed(self, url):
+        """读取该页面缓存的解析结果"""
+        with self._lock:
+            row = self._conn.execute('SELECT parsed FROM responses WHERE url = ?', (url,)).fetchone()
+        if not row or row[0] is None:
+            return None
+        try:
+            return json.loads(row[0])
+        except Exception:
+            return None
+
+    def set_parsed(self, url, parsed):
+        """保存页面的解析结果，页面内容更新时自动失效"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    'UPDATE responses SET parsed = ? WHERE url = ?',
+                    (json.dumps(parsed, ensure_ascii=False), url),
+                )
+
+    def put(self, url, text, etag=None, last_modified=None):
+        """保存页面内容及校验信息（清除旧的解析结果），必要时按最久未访问淘汰旧条目"""
+        if self.ttl_seconds(url) <= 0 or not text:
+            return
+        body = zlib.compress(text.encode('utf-8'), 6)
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                old = self._conn.execute('SELECT size FROM responses WHERE url = ?', (url,)).fetchone()
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO responses '
+                    '(url, site, body, size, stored_at, accessed_at, etag, last_modified, parsed) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)',
+                    (url, site_of(url), body, len(body), now, now, etag, last_modified),
+                )
+                self._total += len(body) - (old[0] if old else 0)
+                self.stats['stores'] += 1
+                self._evict_locked()
+
+    def _evict_locked(self):
+        while self._total > self.max_bytes:
+            rows = self._conn.execute(
+                'SELECT url, size FROM responses ORDER BY accessed_at LIMIT 50'
+            ).fetchall()
+            if not rows:
+                self._total = 0
+                break
+            for url, size in rows:
+                self._conn.execute('DELETE FROM responses WHERE url = ?', (url,))
+                self._total -= size
+                self.stats['evictions'] += 1
+                if self._total <= self.max_bytes:
+                    break
+
+    def summary(self, since=None):
+        """命中统计文本；since 为 snapshot() 的结果时只统计其后的部分"""
+        since = since or {}
+        st = {key: value - since.get(key, 0) for key, value in self.snapshot().items()}
+        lookups = st['hits'] + st['misses']
+        rate = st['hits'] / lookups * 100 if lookups else 0
+        return (f"命中 {st['hits']}，未命中 {st['misses']}（命中率 {rate:.0f}%，其中 304 复用 {st['revalidated']}），"
+                f"节省传输约 {st['bytes_saved'] / 1024:.0f}KB，写入 {st['stores']}，淘汰 {st['evictions']}，"
+                f"占用 {self._total / 1024 / 1024:.1f}MB")
+
+    def close(self):
+        """关闭缓存数据库"""
+        with self._lock:
+            self._conn.close()
+
+
+# HTTP 存档模式：录制（经网络请求并保存响应）/ 回放（只从存档返回，不访问网络）
+ARCHIVE_RECORD = '录制'
+ARCHIVE_REPLAY = '回放'
+
+
+class HttpArchive:
+    """
+    HTTP 请求/响应存档（SQLite，响应体 zlib 压缩），用于离线重现整个抓取过程。
+    录制模式保存经过会话的每个响应（同一请求保留最后一次，但已存档的 200 不会被 304 或错误响应覆盖）；
+    回放模式按 方法+URL 返回存档中的响应，不访问网络，存档中没有的请求返回 404。
+    通过 mount() 挂载到 requests 会话，上层的重试、缓存、流式读取与解析逻辑不变。
+    """
+
+    FILENAME = 'http_archive.db'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS exchanges (
+            method      TEXT NOT NULL,
+            url         TEXT NOT NULL,
+            status      INTEGER NOT NULL,
+            reason      TEXT NOT NULL DEFAULT '',
+            headers     TEXT NOT NULL,
+            body        BLOB NOT NULL,
+            recorded_at REAL NOT NULL,
+            PRIMARY KEY (method, url)
+        );
+    """
+
+    # 回放时响应体已解压，不再保留传输相关的响应头
+    SKIP_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection')
+
+    def __init__(self, path, mode=ARCHIVE_REPLAY):
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+        self._conn.commit()
+        self.stats = {'recorded': 0, 'replayed': 0, 'missing': 0}
+
+    @classmethod
+    def from_config(cls, config, download_path, section='下载设置'):
+        """
+        读取 Http_archive（关闭/录制/回放）与 Http_archive_file（缺省为下载目录下的 http_archive.db），
+        关闭时返回 None
+        """
+        try:
+            mode = str(config.get(section, 'Http_archive')).strip()
+        except Exception:
+            mode = ''
+        if mode not in (ARCHIVE_RECORD, ARCHIVE_REPLAY):
+            return None
+        try:
+            path = str(config.get(section, 'Http_archive_file')).strip()
+        except Exception:
+            path = ''
+        if not path:
+            os.makedirs(download_path, exist_ok=True)
+            path = os.path.join(download_path, cls.FILENAME)
+        return cls(path, mode)
+
+    def mount(self, session):
+        """把存档传输层挂载到会话的 http:// 与 https://，录制时经会话原有的适配器发出请求"""
+        for prefix in ('http://', 'https://'):
+            session.mount(prefix, ArchiveAdapter(self, session.get_adapter(prefix)))
+
+    def record(self, request, response):
+        """保存一个响应（读取完整响应体，之后仍可按流式读取）；已存档的 200 只会被新的 200 覆盖"""
+        body = response.content or b''
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in self.SKIP_HEADERS}
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.execute(
+                    'INSERT INTO exchanges (method, url, status, reason, headers, body, recorded_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT(method, url) DO UPDATE SET status = excluded.status, reason = excluded.reason, '
+                    'headers = excluded.headers, body = excluded.body, recorded_at = excluded.recorded_at '
+                    'WHERE excluded.status = 200 OR exchanges.status != 200',
+                    (request.method, request.url, response.status_code, response.reason or '',
+                     json.dumps(headers, ensure_ascii=False), zlib.compress(body, 6), time.time()),
+                )
+            self.stats['recorded'] += cursor.rowcount
+
+    def replay(self, request):
+        """按存档构造响应；没有存档时返回 404（响应头 X-Archive-Miss）"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT status, reason, headers, body FROM exchanges WHERE method = ? AND url = ?',
+                (request.method, request.url),
+            ).fetchone()
+            self.stats['replayed' if row else 'missing'] += 1
+        response = requests.models.Response()
+        response.url = request.url
+        response.request = request
+        if row is None:
+            response.status_code = 404
+            response.reason = 'Not Archived'
+            response.headers = requests.structures.CaseInsensitiveDict({'X-Archive-Miss': '1'})
+            response._content = b''
+        else:
+            response.status_code = row[0]
+            response.reason = row[1]
+            response.headers = requests.structures.CaseInsensitiveDict(json.loads(row[2]))
+            response._content = zlib.decompress(row[3])
+        # 响应体已在内存中，iter_content 直接按块切分
+        response._content_consumed = True
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+
+    def summary(self):
+        """存档统计文本"""
+        with self._lock:
+            count = self._conn.execute('SELECT COUNT(*) FROM exchanges').fetchone()[0]
+        st = self.stats
+        if self.mode == ARCHIVE_RECORD:
+            return f"录制 {st['recorded']} 个响应，存档共 {count} 个"
+        return f"回放 {st['replayed']} 个响应，存档中缺少 {st['missing']} 个"
+
+    def close(self):
+        """关闭存档数据库"""
+        with self._lock:
+            self._conn.close()
+
+
+class ArchiveAdapter(requests.adapters.BaseAdapter):
+    """挂载到 requests 会话的存档传输层，见 HttpArchive"""
+
+    def __init__(self, archive, inner=None):
+        super().__init__()
+        self.archive = archive
+        self.inner = inner
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if self.archive.mode == ARCHIVE_REPLAY:
+            return self.archive.replay(request)
+        response = self.inner.send(request, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+        self.archive.record(request, response)
+        return response
+
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
+
+
+class MetricsRegistry:
+    """
+    运行指标：按站点统计请求数、响应状态码、传输字节、重试、直连降级、错误类型、缓存命中、
+    限速等待时间与请求耗时直方图，所有请求路径与线程共享。
+    snapshot() 返回累计值，delta() 计算两次快照之差（单次运行的指标），
+    prometheus() 生成 Prometheus 文本格式，serve() 在本地端口提供 /metrics 与 /metrics.json。
+    """
+
+    FILENAME = 'metrics.json'
+    # 请求耗时直方图的桶上限（秒），最后一个桶为 +Inf
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sites = {}
+        self._server = None
+
+    @property
+    def serving(self):
+        """是否已启动指标服务"""
+        return self._server is not None
+
+    def _site(self, site):
+        stats = self._sites.get(site)
+        if stats is None:
+            stats = self._sites[site] = {
+                'requests': 0,
+                'bytes': 0,
+                'status': {},
+                'retries': 0,
+                'direct_fallbacks': 0,
+                'errors': {},
+                'cache': {},
+                'throttle_seconds': 0.0,
+                'latency': {'buckets': [0] * (len(self.LATENCY_BUCKETS) + 1), 'count': 0, 'sum': 0.0},
+            }
+        return stats
+
+    def add(self, site, field, value=1, key=None):
+        """累加计数：key 为空时累加 field，否则累加 field 下的 key（状态码、错误类型、缓存结果）"""
+        with self._lock:
+            stats = self._site(site)
+            if key is None:
+                stats[field] += value
+            else:
+                stats[field][str(key)] = stats[field].get(str(key), 0) + value
+
+    def observe(self, site, seconds):
+        """记录一次请求耗时"""
+        index = len(self.LATENCY_BUCKETS)
+        for i, bound in enumerate(self.LATENCY_BUCKETS):
+            if seconds <= bound:
+                index = i
+                break
+        with self._lock:
+            latency = self._site(site)['latency']
+            latency['buckets'][index] += 1
+            latency['count'] += 1
+            latency['sum'] += seconds
+
+    def record_response(self, url, response, seconds):
+        """
+        记录一次请求（session.get）的结果：耗时、最终状态码，
+        以及 urllib3 在适配器内部自动重试（429/5xx/连接错误）的次数与中间状态码
+        """
+        site = site_of(url)
+        history = getattr(getattr(response.raw, 'retries', None), 'history', None) or ()
+        self.observe(site, seconds)
+        self.add(site, 'requests', 1 + len(history))
+        self.add(site, 'retries', len(history))
+        for attempt in history:
+            if attempt.status:
+                self.add(site, 'status', key=attempt.status)
+            elif attempt.error is not None:
+                self.add(site, 'errors', key=type(attempt.error).__name__)
+        self.add(site, 'status', key=response.status_code)
+
+    @staticmethod
+    def response_size(response):
+        """已读取的响应体字节数（网络传输量，压缩时为压缩后的大小）"""
+        try:
+            return int(response.raw.tell())
+        except Exception:
+            content = getattr(response, '_content', None)
+            return len(content) if isinstance(content, bytes) else 0
+
+    def snapshot(self):
+        """当前累计值：{站点: {...}}"""
+        with self._lock:
+            return json.loads(json.dumps(self._sites))
+
+    @classmethod
+    def delta(cls, before, after):
+        """两次快照之差，用于单次运行的指标"""
+        if isinstance(after, dict):
+            before = before or {}
+            return {key: cls.delta(before.get(key), value) for key, value in after.items()}
+        if isinstance(after, list):
+            before = before or [0] * len(after)
+            return [a - b for a, b in zip(after, before)]
+        return after - (before or 0)
+
+    @classmethod
+    def summarize(cls, sites):
+        """在快照中补充各站点耗时的估计分位数（按桶上限）"""
+        for stats in sites.values():
+            latency = stats['latency']
+            for name, pct in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                latency[name] = cls._quantile(latency, pct)
+        return sites
+
+    @classmethod
+    def _quantile(cls, latency, pct):
+        if not latency['count']:
+            return 0.0
+        target = latency['count'] * pct
+        seen = 0
+        for bound, count in zip(cls.LATENCY_BUCKETS + (float('inf'),), latency['buckets']):
+            seen += count
+            if seen >= target:
+                return bound if bound != float('inf') else cls.LATENCY_BUCKETS[-1]
+        return cls.LATENCY_BUCKETS[-1]
+
+    def dump(self, path, since=None, **extra):
+        """写出 JSON：since 为运行开始时的快照时只写出本次运行的增量"""
+        sites = self.snapshot()
+        if since is not None:
+            sites = self.delta(since, sites)
+        report = dict(extra, written_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'), sites=self.summarize(sites))
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return report
+
+    def prometheus(self):
+        """Prometheus 文本格式（累计值）"""
+        sites = self.snapshot()
+        lines = []
+
+        def series(name, kind, help_text, samples):
+            lines.append(f'# HELP fc2_gather_{name} {help_text}')
+            lines.append(f'# TYPE fc2_gather_{name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f'fc2_gather_{name}{{{label_text}}} {value}')
+
+        series('requests_total', 'counter', 'HTTP requests sent, including retries',
+               [((('site', site),), st['requests']) for site, st in sites.items()])
+        series('responses_total', 'counter', 'HTTP responses by status code',
+               [((('site', site), ('status', status)), count)
+                for site, st in sites.items() for status, count in sorted(st['status'].items())])
+        series('response_bytes_total', 'counter', 'Response bytes read',
+               [((('site', site),), st['bytes']) for site, st in sites.items()])
+        series('retries_total', 'counter', 'Retried requests',
+               [((('site', site),), st['retries']) for site, st in sites.items()])
+        series('direct_fallbacks_total', 'counter', 'Fallbacks to a direct connection',
+               [((('site', site),), st['direct_fallbacks']) for site, st in sites.items()])
+        series('errors_total', 'counter', 'Request errors by exception type',
+               [((('site', site), ('type', name)), count)
+                for site, st in sites.items() for name, count in sorted(st['errors'].items())])
+        series('cache_total', 'counter', 'Response cache lookups by result',
+               [((('site', site), ('result', result)), count)
+                for site, st in sites.items() for result, count in sorted(st['cache'].items())])
+        series('throttle_seconds_total', 'counter', 'Time spent waiting for the rate limiter',
+               [((('site', site),), round(st['throttle_seconds'], 6)) for site, st in sites.items()])
+        lines.append('# HELP fc2_gather_request_duration_seconds Request duration')
+        lines.append('# TYPE fc2_gather_request_duration_seconds histogram')
+        for site, st in sites.items():
+            latency = st['latency']
+            cumulative = 0
+            for bound, count in zip(self.LATENCY_BUCKETS + ('+Inf',), latency['buckets']):
+                cumulative += count
+                lines.append(f'fc2_gather_request_duration_seconds_bucket{{site="{site}",le="{bound}"}} {cumulative}')
+            lines.append(f'fc2_gather_request_duration_seconds_sum{{site="{site}"}} {latency["sum"]:.6f}')
+            lines.append(f'fc2_gather_request_duration_seconds_count{{site="{site}"}} {latency["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='127.0.0.1'):
+        """在本地端口提供 /metrics（Prometheus 文本）与 /metrics.json，已启动时直接返回"""
+        if self._server is not None:
+            return self._server
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = registry.prometheus(), 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path == '/metrics.json':
+                    sites = registry.summarize(registry.snapshot())
+                    body, content_type = json.dumps({'sites': sites}, ensure_ascii=False), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self._server = server
+        return server
+
+
+class StagePipeline:
+    """
+    多阶段流水线：每个阶段有独立的工作线程与有界输入队列。
+    下游队列满时上游阻塞（背压），某一站点变慢只会让其上游排队，不会让另一站点的线程闲置。
+    stages 为 [(名称, 处理函数, 线程数)]，处理函数的返回值作为下一阶段的输入；
+    最后一个阶段的返回值按完成顺序由 run() 产出 (序号, 结果)。
+    """
+
+    _END = object()
+
+    def __init__(self, stages, is_running=None, log=None):
+        self.stages = [(name, func, max(1, int(workers))) for name, func, workers in stages]
+        self.is_running = is_running or (lambda: True)
+        self.log = log or (lambda message: None)
+        self._queues = [queue.Queue(maxsize=workers * 2) for _, _, workers in self.stages]
+        self._output = queue.Queue()
+        self._lock = threading.Lock()
+        self._done = [0] * len(self.stages)
+        self._alive = [workers for _, _, workers in self.stages]
+        self._started = None
+
+    def run(self, items):
+        """依次送入 items，按完成顺序产出 (序号, 结果)；处理失败或已停止的元素结果为 None"""
+        items = list(items)
+        self._started = time.time()
+        threads = [threading.Thread(target=self._feed, args=(items,), daemon=True)]
+        for stage_index, (_, _, workers) in enumerate(self.stages):
+            for _ in range(workers):
+                threads.append(threading.Thread(target=self._work, args=(stage_index,), daemon=True))
+        for thread in threads:
+            thread.start()
+        for _ in range(len(items)):
+            yield self._output.get()
+        for thread in threads:
+            thread.join()
+
+    def _feed(self, items):
+        first = self._queues[0]
+        for index, item in enumerate(items):
+            first.put((index, item))
+        for _ in range(self.stages[0][2]):
+            first.put(self._END)
+
+    def _work(self, stage_index):
+        name, func, _ = self.stages[stage_index]
+        source = self._queues[stage_index]
+        last = stage_index == len(self.stages) - 1
+        while True:
+            entry = source.get()
+            if entry is self._END:
+                break
+            index, item = entry
+            result = None
+            if self.is_running():
+                try:
+                    result = func(item)
+                except Exception as e:
+                    self.log(f"{name}阶段执行失败: {str(e)}")
+            with self._lock:
+                self._done[stage_index] += 1
+            if last or result is None:
+                # 失败或已停止的元素不再进入后续阶段
+                self._output.put((index, result))
+            else:
+                self._queues[stage_index + 1].put((index, result))
+        with self._lock:
+            self._alive[stage_index] -= 1
+            finished = self._alive[stage_index] == 0
+        if finished and not last:
+            for _ in range(self.stages[stage_index + 1][2]):
+                self._queues[stage_index + 1].put(self._END)
+
+    def stats(self):
+        """各阶段统计：已完成数、队列积压、吞吐（个/秒）"""
+        elapsed = max(time.time() - (self._started or time.time()), 1e-6)
+        with self._lock:
+            done = list(self._done)
+        return {
+            name: {'done': done[i], 'queued': self._queues[i].qsize(), 'rate': done[i] / elapsed}
+            for i, (name, _, _) in enumerate(self.stages)
+        }
+
+    @staticmethod
+    def format_stats(stats):
+        """统计信息的简短文字形式"""
+        return '，'.join(f"{name} {st['done']}个 {st['rate']:.1f}/秒 排队{st['queued']}"
+                        for name, st in stats.items())
 
 
 class FC2GatherCore:
     """FC2资源收集核心功能类"""
 
+    # 流式读取时每次读取的字节数
+    STREAM_CHUNK_SIZE = 16 * 1024
+
     def __init__(self, config, log_callback=None):
         self.config = config
         self.log_callback = log_callback
         self.session = None
+        self.rate_limiter = None
+        self.store = None
+        self.cache = None
+        self.archive = None
+        self.journal = None
+        # 请求指标，所有请求路径与线程共享，Metrics_port>0 时在本地端口提供
+        self.metrics = MetricsRegistry()
+        # 合并查询已确定结果的番号 -> search_sukebei 格式的结果，磁力阶段直接使用
+        self._batch_found = {}
         self.is_running = False
         self.current_progress = 0
         self.total_items = 0
+        self._pool_size = 0
+        self._log_lock = threading.Lock()
+        self._stop_event = threading.Event()
 
     def log(self, message):
-        """日志输出"""
-        if self.log_callback:
-            self.log_callback(message)
-        else:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
+        """日志输出（多线程下串行化，避免输出交错）"""
+        with self._log_lock:
+            if self.log_callback:
+                self.log_callback(message)
+            else:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
 
     def read_config_value(self, section, key, default=''):
         """读取配置值"""
@@ -49,6 +1250,60 @@ class FC2GatherCore:
         except Exception:
             return default
 
+    def read_config_int(self, section, key, default=0):
+        """读取整数配置值，无效时返回默认值"""
+        try:
+            return int(str(self.read_config_value(section, key, default)).strip())
+        except Exception:
+            return default
+
+    def get_max_workers(self):
+        """并发线程数（Max_dl），至少为1"""
+        return max(1, self.read_config_int('下载设置', 'Max_dl', 2))
+
+    def open_store(self, download_path=None):
+        """打开下载目录下的结果库，下载目录变更时重新打开"""
+        if download_path is None:
+            download_path = self.read_config_value('下载设置', 'Download_path', './Downloads/')
+        path = os.path.join(download_path, ResultStore.FILENAME)
+        if self.store is not None and os.path.abspath(self.store.path) == os.path.abspath(path):
+            return self.store
+        if self.store is not None:
+            self.store.close()
+        self.store = ResultStore.open_in(download_path)
+        return self.store
+
+    def open_cache(self, download_path=None):
+        """按配置打开响应缓存（Cache=否 时关闭缓存并返回 None）"""
+        if not self._is_true(self.read_config_value('下载设置', 'Cache', '是')):
+            if self.cache is not None:
+                self.cache.close()
+                self.cache = None
+            return None
+        if download_path is None:
+            download_path = self.read_config_value('下载设置', 'Download_path', './Downloads/')
+        if self.cache is not None:
+            if os.path.abspath(self.cache.path) == os.path.abspath(ResponseCache.path_in(download_path)):
+                # 同一缓存库继续使用（保留连接与统计），只更新有效期与大小上限
+                self.cache.ttl_hours, self.cache.max_bytes = ResponseCache.limits_from_config(self.config)
+                return self.cache
+            self.cache.close()
+        self.cache = ResponseCache.from_config(self.config, download_path)
+        return self.cache
+
+    def open_archive(self, download_path=None):
+        """按配置（Http_archive）打开 HTTP 录制/回放存档，关闭时返回 None"""
+        if download_path is None:
+            download_path = self.read_config_value('下载设置', 'Download_path', './Downloads/')
+        if self.archive is not None:
+            self.archive.close()
+        self.archive = HttpArchive.from_config(self.config, download_path)
+        return self.archive
+
+    def base_url(self, site):
+        """站点地址（fc2/sukebei），可由 FC2_base_url / Sukebei_base_url 改为本地模拟服务器"""
+        return base_url_from_config(self.config, site)
+
     def _is_true(self, val):
         """判断配置值是否为真"""
         if val is None:
@@ -115,11 +1370,29 @@ class FC2GatherCore:
             raise_on_status=False,
             respect_retry_after_header=True,
         )
-        adapter = requests.adapters.HTTPAdapter(max_retries=retry_strategy)
+        # 连接池大小与并发线程数匹配，避免多线程时连接被反复丢弃重建
+        pool_size = max(10, self.get_max_workers(), self.get_stage_workers('fc2'), self.get_stage_workers('sukebei'))
+        adapter = requests.adapters.HTTPAdapter(
+            max_retries=retry_strategy,
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+        )
         sess.mount('http://', adapter)
         sess.mount('https://', adapter)
 
         self.session = sess
+        self._pool_size = pool_size
+        self.rate_limiter = HostRateLimiter.from_config(self.config)
+        for site in DEFAULT_BASE_URLS:
+            # 登记自定义站点地址，使限速与缓存按站点生效
+            self.base_url(site)
+        if self.open_archive() is not None:
+            self.archive.mount(sess)
+            if self.archive.mode == ARCHIVE_REPLAY:
+                # 回放不访问网络，不限速
+                self.rate_limiter = HostRateLimiter()
+            self.log(f"HTTP存档（{self.archive.mode}）: {self.archive.path}")
+        self.start_metrics_server()
         if manual_enabled:
             self.log("HTTP会话创建完成（使用手动代理）")
         elif auto_enabled and PACSession is not None:
@@ -132,8 +1405,39 @@ class FC2GatherCore:
                 pass
         else:
             self.log("HTTP会话创建完成（直连）")
+        limits = ', '.join(f'{site} {rate:g}次/秒(突发{burst})' for site, (rate, burst) in self.rate_limiter.limits.items())
+        self.log(f"请求限速: {limits}")
         return sess
 
+    def start_metrics_server(self):
+        """Metrics_port>0 时在本地端口提供 /metrics（Prometheus）与 /metrics.json，端口被占用时仅记录日志"""
+        port = self.read_config_int('下载设置', 'Metrics_port', 0)
+        if port <= 0 or self.metrics.serving:
+            return
+        try:
+            self.metrics.serve(port)
+            self.log(f"指标服务: http://127.0.0.1:{port}/metrics")
+        except OSError as e:
+            self.log(f"指标服务启动失败（端口 {port}）: {str(e)}")
+
+    def dump_metrics(self, download_path, since, task):
+        """把本次运行的请求指标写入下载目录下的 metrics.json，并按站点输出摘要"""
+        try:
+            os.makedirs(download_path, exist_ok=True)
+            report = self.metrics.dump(os.path.join(download_path, MetricsRegistry.FILENAME), since, task=task)
+        except Exception as e:
+            self.log(f"写入运行指标失败: {str(e)}")
+            return
+        for site, stats in report['sites'].items():
+            if not stats['requests'] and not sum(stats['cache'].values()):
+                continue
+            status = '，'.join(f'{code}×{count}' for code, count in sorted(stats['status'].items()) if count)
+            self.log(
+                f"请求指标 {site}: 请求 {stats['requests']}，重试 {stats['retries']}，"
+                f"直连降级 {stats['direct_fallbacks']}，状态码 {status or '无'}，"
+                f"p95 {stats['latency']['p95']:g}s，限速等待 {stats['throttle_seconds']:.1f}s"
+            )
+
     def _browser_headers(self, url: str):
         """生成浏览器请求头"""
         ua = (
@@ -150,22 +1454,83 @@ class FC2GatherCore:
             'Upgrade-Insecure-Requests': '1',
         }
 
-        # 针对FC2添加Referer
-        if 'adult.contents.fc2.com' in url:
-            headers['Referer'] = 'https://adult.contents.fc2.com/'
-            headers['Origin'] = 'https://adult.contents.fc2.com'
-        elif 'sukebei.nyaa.si' in url:
-            headers['Referer'] = 'https://sukebei.nyaa.si/'
-            headers['Origin'] = 'https://sukebei.nyaa.si'
+        # 针对FC2/sukebei添加Referer
+        site = site_of(url)
+        if site in DEFAULT_BASE_URLS:
+            base = self.base_url(site)
+            headers['Referer'] = base + '/'
+            headers['Origin'] = base
 
         return headers
 
-    def requests_web(self, url):
-        """获取网页数据"""
+    def requests_web(self, url, max_age=None, stop=None):
+        """
+        获取网页数据。启用缓存时优先返回未过期的缓存内容；
+        max_age 为可接受的缓存秒数，缺省按站点有效期，0 表示必须向服务器确认。
+        """
+        return self.fetch_page(url, max_age, stop).text
+
+    def fetch_page(self, url, max_age=None, stop=None):
+        """
+        获取网页并返回 FetchResult。缓存过期（或 max_age=0）时携带
+        If-None-Match/If-Modified-Since 发起条件请求，304 时直接使用缓存内容。
+        stop 为正则时流式读取响应，读到 stop 即停止，返回（并缓存）已读取的部分。
+        """
         if not self.session:
             self.build_session()
 
+        cache = self.cache
+        if self.archive is not None and self.archive.mode == ARCHIVE_RECORD:
+            # 录制时绕过响应缓存与条件请求，保证每个页面都以完整的 200 响应存入存档
+            cache = None
+        entry = None
+        if cache is not None:
+            entry = cache.lookup(url, max_age)
+            if entry is not None and entry['fresh']:
+                self.metrics.add(site_of(url), 'cache', key='hit')
+                return FetchResult(entry['text'], True)
+
+        validators = {}
+        if entry is not None:
+            if entry['etag']:
+                validators['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                validators['If-Modified-Since'] = entry['last_modified']
+
+        fetched = self._fetch(url, validators, stop)
+        if fetched is not None and fetched[0].status_code == 304 and entry is not None:
+            cache.mark_not_modified(url)
+            self.metrics.add(site_of(url), 'cache', key='revalidated')
+            return FetchResult(entry['text'], True)
+        if cache is not None:
+            self.metrics.add(site_of(url), 'cache', key='miss')
+        if fetched is None:
+            return FetchResult(None, False)
+
+        response, text = fetched
+        if text is not None and cache is not None:
+            cache.put(url, text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return FetchResult(text, False)
+
+    def _parse_cached(self, url, result, parse):
+        """页面内容未变化时复用缓存中的解析结果，否则调用 parse 解析并写回缓存"""
+        if self.cache is not None and result.unchanged:
+            parsed = self.cache.get_parsed(url)
+            if parsed is not None:
+                return parsed
+        parsed = parse(result.text)
+        if self.cache is not None:
+            self.cache.set_parsed(url, parsed)
+        return parsed
+
+    def _fetch(self, url, extra_headers=None, stop=None):
+        """
+        发起网络请求（含重试与直连降级），返回 (响应对象, 响应文本)，失败返回 None；非 200 响应的文本为 None。
+        响应体在重试循环内读取（stop 见 _response_text），读取中途连接中断或超时同样重试。
+        """
         headers = self._browser_headers(url)
+        headers.update(extra_headers or {})
+        site = site_of(url)
         timeout_seconds = 15
         max_retry = self.read_config_value('下载设置', 'Max_retry', '3')
         verify_ssl = self.read_config_value('下载设置', 'VerifySSL', '否')
@@ -183,69 +1548,112 @@ class FC2GatherCore:
                     if i > 0:
                         req_headers['Connection'] = 'close'
 
-                    response = self.session.get(
-                        url,
-                        headers=req_headers,
-                        timeout=timeout_seconds,
-                        verify=self._is_true(verify_ssl),
-                    )
-                    response.encoding = 'utf-8'
-                    return response.text
+                    return self._request(self.session, url, req_headers, timeout_seconds, verify_ssl, stop)
                 except Exception as e:
                     # 针对常见网络错误给出更友好的提示
                     name = type(e).__name__
+                    self.metrics.add(site, 'errors', key=name)
                     if name == 'ConnectionError':
                         self.log('连接错误：可能是地区限制、需要登录或站点防护。建议开启稳定代理（PAC/手动）并稍后重试。')
                     elif name == 'SSLError':
                         self.log('SSL连接异常：可在设置中关闭“验证SSL证书”后再试。')
 
+                    if self._stop_event.is_set():
+                        # 已请求停止：不再重试或直连降级
+                        return None
                     if i == attempts - 1:
                         self.log(f'请求失败: {name}')
                         raise
                     backoff = min(2 ** i, 5)
+                    self.metrics.add(site, 'retries')
                     self.log(f'第 {i+1}/{attempts} 次失败，{backoff}s后重试')
-                    time.sleep(backoff)
+                    self._stop_event.wait(backoff)
         except Exception:
             # 代理失败时尝试直连
             self.log('尝试直连重试...')
+            self.metrics.add(site, 'direct_fallbacks')
             try:
                 direct = requests.Session()
                 direct.trust_env = False
+                if self.archive is not None:
+                    # 直连同样经过存档：录制时保存响应，回放时不访问网络
+                    self.archive.mount(direct)
                 direct_headers = dict(headers)
                 direct_headers['Connection'] = 'close'
-                response = direct.get(
-                    url,
-                    headers=direct_headers,
-                    timeout=timeout_seconds,
-                    verify=self._is_true(verify_ssl),
-                )
-                response.encoding = 'utf-8'
-                return response.text
+                return self._request(direct, url, direct_headers, timeout_seconds, verify_ssl, stop)
             except Exception as e:
+                self.metrics.add(site, 'errors', key=type(e).__name__)
                 self.log(f'直连也失败: {str(e)}')
                 return None
 
+    def _request(self, session, url, headers, timeout_seconds, verify_ssl, stop=None):
+        """限速后发送一次 GET 并读取响应体，返回 (响应对象, 响应文本)；请求或读取出错时抛出异常"""
+        self.metrics.add(site_of(url), 'throttle_seconds', self.rate_limiter.acquire(url, self._stop_event))
+        started = time.perf_counter()
+        try:
+            response = session.get(
+                url,
+                headers=headers,
+                timeout=timeout_seconds,
+                verify=self._is_true(verify_ssl),
+                stream=stop is not None,
+            )
+        except Exception:
+            # 未收到响应的请求也计数；读取响应体时出错的请求已由 record_response 计数
+            self.metrics.add(site_of(url), 'requests')
+            raise
+        self.metrics.record_response(url, response, time.perf_counter() - started)
+        response.encoding = 'utf-8'
+        return response, self._response_text(url, response, stop)
+
+    def _response_text(self, url, response, stop=None):
+        """
+        取出响应文本；非 200 状态视为失败，避免把错误页当作正常内容解析或缓存（304 由调用方使用缓存内容）。
+        stop 为正则时按块读取响应体，读到 stop 后即关闭连接，不再下载剩余部分。
+        """
+        if response.status_code != 200:
+            if response.status_code != 304:
+                self.log(f'请求返回状态码 {response.status_code}: {url}')
+            response.close()
+            return None
+        if stop is None:
+            text = response.text
+            self.metrics.add(site_of(url), 'bytes', MetricsRegistry.response_size(response))
+            return text
+        scanner = fc2_parser.StreamScanner(stop)
+        try:
+            for chunk in response.iter_content(chunk_size=self.STREAM_CHUNK_SIZE, decode_unicode=True):
+                if scanner.feed(chunk):
+                    break
+        finally:
+            self.metrics.add(site_of(url), 'bytes', MetricsRegistry.response_size(response))
+            response.close()
+        return scanner.text
+
+    def stream_stop(self, stop):
+        """启用流式读取（Stream=是）时返回停止条件 stop，否则返回 None（读取完整页面）"""
+        return stop if self._is_true(self.read_config_value('下载设置', 'Stream', '是')) else None
+
     def fc2_get_current_page(self, txt):
         """获取当前页码"""
-        pattern = re.compile('<span class="items" aria-selected="true">([0-9]*)</span>', re.S)
-        keys = re.findall(pattern, txt or '')
-        if keys:
-            return int(keys[0])
-        return 1
+        return fc2_parser.current_page(txt)
 
     def fc2_get_next_page(self, txt):
         """获取下一页"""
-        pattern = re.compile('<span class="items" aria-selected="true">.*?</span>.*?<a data-pjx="pjx-container" data-link-name="pager".*?href=".*?&page=([0-9]*)" class="items">.*?<', re.S)
-        keys = re.findall(pattern, txt or '')
-        if keys:
-            return int(keys[0])
-        return 0
+        return fc2_parser.next_page(txt)
+
+    def fc2_get_last_page(self, txt):
+        """获取末页页码（分页链接中的最大页码），无分页时返回 0"""
+        return fc2_parser.last_page(txt)
 
     def parse_fc2_id(self, text):
-        """解析FC2番号"""
-        pattern = re.compile(r'(?:FC2-PPV-)?(\d+)', re.IGNORECASE)
-        matches = pattern.findall(text or '')
-        return list(set(matches))  # 去重
+        """解析FC2番号：保持输入顺序去重，忽略 # 注释，无法识别为番号的内容记入日志"""
+        fc2_ids, rejected = fc2_parser.tokenize_input_ids(text)
+        if rejected:
+            preview = '，'.join(f"第{line}行 {token}" for line, token in rejected[:10])
+            suffix = ' ...' if len(rejected) > 10 else ''
+            self.log(f"忽略 {len(rejected)} 处无法识别为番号的内容: {preview}{suffix}")
+        return fc2_ids
 
     def _set_url_query_param(self, url, name, value):
         """设置或替换URL中的查询参数"""
@@ -263,36 +1671,16 @@ class FC2GatherCore:
 
     def detect_fc2_page_type(self, html, url):
         """检测FC2页面类型: 用户作品列表/搜索结果/作品详情/未知"""
-        try:
-            path = urlparse(url).path
-        except Exception:
-            path = ''
-        page_type = 'unknown'
-        if re.search(r'^/users/[^/]+/articles', path):
-            page_type = 'user_articles'
-        elif re.search(r'^/search/', path):
-            page_type = 'search_results'
-        elif re.search(r'^/article/\d+/?$', path):
-            page_type = 'article_detail'
-
-        # 进一步依据HTML中的结构进行校验
-        try:
-            if 'c-cntCard-110-f' in (html or ''):
-                # 列表页通常包含卡片元素
-                if page_type == 'unknown':
-                    page_type = 'list_unknown'
-        except Exception:
-            pass
-
-        return page_type
+        return fc2_parser.page_type_of(url, 'c-cntCard-110-f' in (html or ''))
 
     def get_fc2_info(self, fc2_id):
         """获取FC2影片信息"""
-        url = f"https://adult.contents.fc2.com/article/{fc2_id}/"
+        url = f"{self.base_url('fc2')}/article/{fc2_id}/"
 
         try:
             self.log(f"正在获取番号 {fc2_id} 的信息...")
-            html = self.requests_web(url)
+            result = self.fetch_page(url)
+            html = result.text
 
             if not html:
                 self.log(f"番号 {fc2_id}: 无法获取页面内容")
@@ -307,10 +1695,7 @@ class FC2GatherCore:
                 'url': url,
             }
 
-            title_pattern = re.compile(r'<h3[^>]*>([^<]+)</h3>', re.S)
-            title_match = title_pattern.search(html or '')
-            if title_match:
-                info['title'] = title_match.group(1).strip()
+            info['title'] = self._parse_cached(url, result, self._parse_article)['title']
 
             self.log(f"番号 {fc2_id}: 获取成功 - {info['title']}")
             return info
@@ -319,55 +1704,189 @@ class FC2GatherCore:
             self.log(f"番号 {fc2_id}: 处理失败 - {str(e)}")
             return None
 
+    def _parse_article(self, html):
+        """解析作品详情页：标题"""
+        return fc2_parser.parse_article(html)
+
     def search_magnet_links(self, fc2_id):
-        """搜索磁力链接（使用sukebei.nyaa.si）"""
-        search_url = f"https://sukebei.nyaa.si/?f=0&c=0_0&q=FC2+PPV+{fc2_id}"
+        """搜索磁力链接（使用sukebei.nyaa.si），页面获取失败时返回 None"""
+        found = self.search_sukebei(fc2_id)
+        return None if found is None else found['magnets']
+
+    def search_sukebei(self, fc2_id):
+        """
+        在 sukebei 搜索番号，返回 {'magnets': [...], 'title': 首条结果标题}，
+        magnets 按 Magnet_rank 排序并只保留前 Magnet_top 个；页面获取失败时返回 None
+        """
+        found = self._batch_found.pop(fc2_id, None)
+        if found is not None:
+            self.log(f"番号 {fc2_id}: 合并查询找到 {len(found['rows'])} 个磁力链接，保留 {len(found['magnets'])} 个")
+            return found
+
+        search_url = f"{self.base_url('sukebei')}/?f=0&c=0_0&q=FC2+PPV+{fc2_id}"
 
         try:
             self.log(f"正在搜索番号 {fc2_id} 的磁力链接...")
-            html = self.requests_web(search_url)
+            # 结果表格读完即停止，不下载分页与页脚
+            result = self.fetch_page(search_url, stop=self.stream_stop(fc2_parser.STOP_SEARCH_RESULTS))
 
-            if not html:
-                return []
+            if not result.text:
+                return None
 
-            magnet_pattern = re.compile(r'magnet:\?[^"\'\s]+', re.S)
-            magnets = magnet_pattern.findall(html)
+            parsed = self._parse_cached(search_url, result, self._parse_search)
+            policy, top = self.get_magnet_rank()
+            rows = parsed.get('rows')
+            if rows:
+                magnets = [row['magnet'] for row in fc2_parser.rank_rows(rows, policy, top)]
+            else:
+                # 未能按行解析（页面结构变化）时退回页面中的全部磁力链接（按信息哈希去重）
+                torrents = {}
+                for magnet in parsed['magnets']:
+                    torrents.setdefault(fc2_parser.infohash_of(magnet) or magnet, magnet)
+                magnets = list(torrents.values())
+                magnets = magnets[:top] if top > 0 else magnets
+            self.log(f"番号 {fc2_id}: 找到 {len(rows or parsed['magnets'])} 个磁力链接，保留 {len(magnets)} 个")
+            return {'magnets': magnets, 'title': parsed['title'], 'rows': rows or []}
 
-            unique_magnets = list(set(magnets))
-            self.log(f"番号 {fc2_id}: 找到 {len(unique_magnets)} 个磁力链接")
+        except Exception as e:
+            self.log(f"搜索磁力链接失败: {str(e)}")
+            return None
 
-            return unique_magnets
+    def search_sukebei_batch(self, fc2_ids):
+        """
+        合并查询：一次搜索多个番号，按结果标题中的番号把结果行分配给各番号。
+        返回 {番号: search_sukebei 格式的结果}，只包含能确定结果的番号：
+        结果少于一页时未出现的番号为无磁力，否则留给单独查询；页面获取失败时返回空字典
+        """
+        search_url = f"{self.base_url('sukebei')}/?f=0&c=0_0&q={quote_plus(fc2_parser.batch_query(fc2_ids))}"
 
+        try:
+            self.log(f"正在合并查询 {len(fc2_ids)} 个番号的磁力链接...")
+            result = self.fetch_page(search_url, stop=self.stream_stop(fc2_parser.STOP_SEARCH_RESULTS))
+            if not result.text:
+                return {}
+            parsed = self._parse_cached(search_url, result, self._parse_search)
         except Exception as e:
-            self.log(f"搜索磁力链接失败: {str(e)}")
-            return []
+            self.log(f"合并查询失败: {str(e)}")
+            return {}
+
+        rows = parsed.get('rows') or []
+        if not rows and parsed['magnets']:
+            # 页面有磁力却无法按行解析（页面结构变化），全部留给单独查询
+            return {}
+        attributed = fc2_parser.attribute_rows(rows, fc2_ids)
+        complete = len(rows) < fc2_parser.SUKEBEI_PAGE_SIZE
+        policy, top = self.get_magnet_rank()
+        found = {}
+        for fc2_id in fc2_ids:
+            id_rows = attributed.get(fc2_id)
+            if id_rows:
+                magnets = [row['magnet'] for row in fc2_parser.rank_rows(id_rows, policy, top)]
+                found[fc2_id] = {'magnets': magnets, 'title': id_rows[0]['title'], 'rows': id_rows}
+            elif complete:
+                found[fc2_id] = {'magnets': [], 'title': '', 'rows': []}
+        return found
+
+    def get_search_batch(self):
+        """合并查询时每次搜索的番号数（Search_batch），1 为逐个查询"""
+        return max(1, self.read_config_int('下载设置', 'Search_batch', 1))
+
+    def _prefetch_searches(self, fc2_ids, batch):
+        """
+        合并查询预取：每 batch 个番号一次 sukebei 搜索（按 sukebei 阶段线程数并发），
+        确定结果的番号在磁力阶段直接使用，其余仍单独查询
+        """
+        chunks = [fc2_ids[i:i + batch] for i in range(0, len(fc2_ids), batch)]
+        self._batch_found = {}
+        for _, _, found in self.run_bounded(self.search_sukebei_batch, chunks, self.get_stage_workers('sukebei')):
+            self._batch_found.update(found or {})
+        self.log(f"合并查询：{len(chunks)} 次搜索确定 {len(self._batch_found)}/{len(fc2_ids)} 个番号，其余单独查询")
+
+    def _parse_search(self, html):
+        """解析 sukebei 搜索结果页：磁力链接、首条结果标题与各结果行"""
+        return fc2_parser.parse_search(html)
+
+    def is_skip_found_enabled(self):
+        """是否跳过结果库中已有磁力的番号（Skip_found）"""
+        return self._is_true(self.read_config_value('下载设置', 'Skip_found', '否'))
+
+    def is_dedupe_enabled(self):
+        """是否按信息哈希跨批次去重输出的磁力（Dedupe）"""
+        return self._is_true(self.read_config_value('下载设置', 'Dedupe', '是'))
+
+    def get_magnet_rank(self):
+        """磁力排序方式（Magnet_rank）与每个番号保留的数量（Magnet_top，0 为全部）"""
+        policy = str(self.read_config_value('下载设置', 'Magnet_rank', '做种')).strip()
+        if policy not in fc2_parser.RANK_POLICIES:
+            policy = '做种'
+        return policy, max(0, self.read_config_int('下载设置', 'Magnet_top', 1))
+
+    def fill_missing_titles(self, progress_callback=None):
+        """
+        补全结果库中缺少标题的番号（仅磁力/延迟标题模式下产生），
+        并发获取作品页标题，返回补全的数量
+        """
+        self.is_running = True
+        self._stop_event.clear()
+        store = self.open_store()
+        self.open_cache()
+        fc2_ids = store.ids_without_title()
+        if not fc2_ids:
+            self.log("结果库中没有缺少标题的番号")
+            return 0
+        self.log(f"开始补全 {len(fc2_ids)} 个番号的标题")
+        titles = {}
+        done_count = 0
+        for _, fc2_id, info in self.run_bounded(self.get_fc2_info, fc2_ids, self.get_max_workers()):
+            done_count += 1
+            if info and info['title']:
+                titles[fc2_id] = info['title']
+            if progress_callback:
+                progress_callback(done_count / len(fc2_ids) * 100)
+        store.update_titles(titles)
+        self.log(f"标题补全完成：{len(titles)}/{len(fc2_ids)}")
+        return len(titles)
 
     def save_results(self, results, download_path):
-        """保存结果到文件"""
+        """由结果库导出本批次的 magnet_{时间}.txt 与 details_{时间}.txt（results 只决定番号及其顺序）"""
         if not os.path.exists(download_path):
             os.makedirs(download_path)
 
+        items = self.open_store(download_path).get_items([result['id'] for result in results])
+        rows = [(result['id'], items[store_key(result['id'])]) for result in results
+                if store_key(result['id']) in items]
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
         magnet_file = os.path.join(download_path, f"magnet_{timestamp}.txt")
+        entries = [(fc2_id, magnet) for fc2_id, item in rows
+                   if item['status'] == STATUS_FOUND for magnet in item['magnets']]
+        dedupe = self.is_dedupe_enabled()
+        if dedupe:
+            # 按信息哈希跨批次去重：以往已输出过的种子不再写入
+            kept = self.open_store(download_path).unemitted_magnets(entries)
+            if len(kept) < len(entries):
+                self.log(f"去重：跳过 {len(entries) - len(kept)} 个以往已输出过的磁力链接")
+            entries = kept
         with open(magnet_file, 'w', encoding='utf-8') as f:
-            for result in results:
-                if result.get('magnets'):
-                    for magnet in result['magnets']:
-                        f.write(f"{magnet}\n")
+            for _, magnet in entries:
+                f.write(f"{magnet}\n")
+        if dedupe:
+            # 写出成功后才登记，写文件失败时这些种子下次仍会输出
+            self.open_store(download_path).mark_emitted(entries)
 
         detail_file = os.path.join(download_path, f"details_{timestamp}.txt")
         with open(detail_file, 'w', encoding='utf-8') as f:
-            for result in results:
-                f.write(f"番号: {result['id']}\n")
-                f.write(f"标题: {result['title']}\n")
-                f.write(f"URL: {result['url']}\n")
-                if result.get('magnets'):
+            for fc2_id, item in rows:
+                magnets = item['magnets'] if item['status'] == STATUS_FOUND else []
+                f.write(f"番号: {fc2_id}\n")
+                f.write(f"标题: {item['title']}\n")
+                f.write(f"URL: {item['url']}\n")
+                if magnets:
                     f.write("磁力链接:\n")
-                    for idx, magnet in enumerate(result['magnets']):
+                    for idx, magnet in enumerate(magnets):
                         # 每条磁链独立一行，并在多条磁链之间增加空行便于辨识
                         f.write(f"  {magnet}\n")
-                        if idx < len(result['magnets']) - 1:
+                        if idx < len(magnets) - 1:
                             f.write("\n")
                 f.write("-" * 50 + "\n")
 
@@ -375,10 +1894,17 @@ class FC2GatherCore:
         self.log(f"磁力链接: {magnet_file}")
         self.log(f"详细信息: {detail_file}")
 
-    def process_fc2_list(self, input_data, progress_callback=None):
-        """处理FC2番号列表"""
+    def process_fc2_list(self, input_data, progress_callback=None, resume=False, title_mode=None):
+        """
+        处理FC2番号列表（按 Max_dl 并发）。
+        resume=True 时读取断点日志，跳过上次已解决的番号；否则重新开始一个批次。
+        title_mode 为 完整/仅磁力/延迟，缺省读取配置 Title_mode。
+        """
         self.is_running = True
+        self._stop_event.clear()
         results = []
+        journal = None
+        metrics_since = self.metrics.snapshot()
 
         try:
             if os.path.isfile(input_data):
@@ -396,140 +1922,393 @@ class FC2GatherCore:
 
             self.total_items = len(fc2_ids)
             download_path = self.read_config_value('下载设置', 'Download_path', './Downloads/')
-
-            for i, fc2_id in enumerate(fc2_ids):
-                if not self.is_running:
-                    break
-
-                self.log(f"进度: {i+1}/{self.total_items}")
-
-                info = self.get_fc2_info(fc2_id)
-                if info:
-                    magnets = self.search_magnet_links(fc2_id)
-                    info['magnets'] = magnets
-                    results.append(info)
-
+            store = self.open_store(download_path)
+            cache = self.open_cache(download_path)
+            cache_since = cache.snapshot() if cache is not None else None
+
+            # 按输入顺序回填结果，完成顺序与输入顺序无关
+            slots = [None] * self.total_items
+            journal = CheckpointJournal.open_in(download_path)
+            if resume:
+                done = journal.resolved()
+                for index, fc2_id in enumerate(fc2_ids):
+                    record = done.get(store_key(fc2_id))
+                    if record:
+                        slots[index] = {
+                            'id': fc2_id, 'title': record['title'], 'magnet': '', 'size': '',
+                            'date': '', 'url': record['url'], 'magnets': record['magnets'],
+                        }
+                        store.record(fc2_id, record['status'], record['title'], record['url'], record['magnets'])
+                skipped = sum(1 for slot in slots if slot)
+                self.log(f"断点续传：跳过 {skipped} 个已完成的番号")
+            else:
+                journal.clear()
+            self.journal = journal
+
+            if self.is_skip_found_enabled():
+                # 一次索引查询找出结果库中已有磁力的番号，直接使用库中的结果
+                pending = [fc2_id for fc2_id, slot in zip(fc2_ids, slots) if slot is None]
+                found = store.ids_with_magnet(pending)
+                items = store.get_items(found) if found else {}
+                for index, fc2_id in enumerate(fc2_ids):
+                    item = items.get(store_key(fc2_id))
+                    if slots[index] is None and item:
+                        slots[index] = {
+                            'id': fc2_id, 'title': item['title'], 'magnet': '', 'size': '',
+                            'date': '', 'url': item['url'], 'magnets': item['magnets'],
+                        }
+                if found:
+                    self.log(f"跳过 {len(found)} 个结果库中已有磁力的番号（Skip_found）")
+
+            todo = [i for i, slot in enumerate(slots) if slot is None]
+            done_count = self.total_items - len(todo)
+
+            if title_mode not in TITLE_MODES:
+                title_mode = self.get_title_mode()
+            # 作品页与 sukebei 搜索分为两个阶段，各自的线程数与队列互不阻塞
+            stages = [('磁力', lambda stage: self._search_stage(stage, title_mode), self.get_stage_workers('sukebei'))]
+            if title_mode == TITLE_FULL:
+                stages.insert(0, ('作品页', lambda fc2_id: self._info_stage(fc2_id, title_mode),
+                                  self.get_stage_workers('fc2')))
+            workers = max(count for _, _, count in stages)
+            if not self.session or self._pool_size < workers:
+                self.build_session()
+            self.log(f"标题获取方式: {title_mode}，" + '，'.join(f"{name}线程数: {count}" for name, _, count in stages))
+
+            batch = self.get_search_batch()
+            if batch > 1 and todo:
+                self._prefetch_searches([fc2_ids[i] for i in todo], batch)
+
+            if title_mode == TITLE_FULL:
+                feed = [fc2_ids[i] for i in todo]
+            else:
+                # 不下载作品页时直接从磁力阶段开始
+                feed = [self._info_stage(fc2_ids[i], title_mode) for i in todo]
+            pipeline = StagePipeline(stages, lambda: self.is_running, self.log)
+            for position, info in pipeline.run(feed):
+                slots[todo[position]] = info
+                done_count += 1
+                self.log(f"进度: {done_count}/{self.total_items}")
                 if progress_callback:
-                    progress_callback((i + 1) / self.total_items * 100)
+                    progress_callback(done_count / self.total_items * 100, pipeline.stats())
+            self.log(f"阶段统计: {StagePipeline.format_stats(pipeline.stats())}")
+
+            results = [info for info in slots if info]
 
             if results:
                 self.save_results(results, download_path)
-
-            self.log(f"处理完成！共处理 {len(results)} 个番号")
+            if self.cache is not None:
+                self.log(f"响应缓存: {self.cache.summary(cache_since)}")
+            if self.archive is not None:
+                self.log(f"HTTP存档: {self.archive.summary()}")
+            self.dump_metrics(download_path, metrics_since, '获取磁力')
+
+            if self.is_running:
+                # 整批完成，断点日志不再需要
+                journal.clear()
+                self.log(f"处理完成！共处理 {len(results)} 个番号")
+            else:
+                self.log(f"处理已停止！已处理 {len(results)} 个番号，可勾选“断点续传”继续")
             return results
 
         except Exception as e:
             self.log(f"处理过程出错: {str(e)}")
             self.log(format_exc())
             return results
+        finally:
+            self.journal = None
+            self._batch_found = {}
+            if journal is not None:
+                journal.close()
+            if self.store is not None:
+                self.store.flush()
+
+    def _info_stage(self, fc2_id, title_mode=TITLE_FULL):
+        """作品页阶段：完整模式下获取作品信息，返回 (番号, 信息, 作品页是否失败)"""
+        info = None
+        article_failed = False
+        if title_mode == TITLE_FULL:
+            info = self.get_fc2_info(fc2_id)
+            if not self.is_running:
+                return None
+            article_failed = not info
+            if article_failed:
+                # 作品页不可用（如地区限制）时仍搜索磁力，避免遗漏 sukebei 上已有的资源
+                self.log(f"番号 {fc2_id}: 作品页获取失败，继续搜索磁力")
+        if not info:
+            info = {
+                'id': fc2_id,
+                'title': '',
+                'magnet': '',
+                'size': '',
+                'date': '',
+                'url': f"{self.base_url('fc2')}/article/{fc2_id}/",
+            }
+        return fc2_id, info, article_failed
+
+    def _search_stage(self, stage, title_mode=TITLE_FULL):
+        """磁力阶段：搜索 sukebei 并记录结果，返回作品信息（作品页与搜索均失败时返回 None）"""
+        fc2_id, info, article_failed = stage
+        found = self.search_sukebei(fc2_id)
+        if found is None:
+            if not self.is_running:
+                return None
+            self._record_result(fc2_id, STATUS_ERROR, info['title'], info['url'])
+            if article_failed:
+                return None
+            info['magnets'] = []
+            return info
+
+        if title_mode == TITLE_LAZY and not info['title']:
+            info['title'] = found['title']
+        magnets = found['magnets']
+        status = STATUS_FOUND if magnets else STATUS_NO_MAGNET
+        self._record_result(fc2_id, status, info['title'], info['url'], magnets)
+        info['magnets'] = magnets
+        return info
+
+    def get_stage_workers(self, site):
+        """流水线各阶段线程数（Workers_fc2 / Workers_sukebei），未配置时使用 Max_dl"""
+        return max(1, self.read_config_int('下载设置', f'Workers_{site}', self.get_max_workers()))
+
+    def get_title_mode(self):
+        """标题获取方式（Title_mode），无效值按“完整”处理"""
+        mode = str(self.read_config_value('下载设置', 'Title_mode', TITLE_FULL)).strip()
+        return mode if mode in TITLE_MODES else TITLE_FULL
+
+    def _record_result(self, fc2_id, status, title='', url='', magnets=None):
+        """记录单个番号的最终结果"""
+        self.store.record(fc2_id, status, title, url, magnets)
+        if self.journal is not None:
+            self.journal.append(fc2_id, status, title, url, magnets)
+
+    def run_bounded(self, func, items, workers):
+        """
+        有界并发执行：同时最多提交 workers*2 个任务，按完成顺序产出 (序号, 元素, 结果)。
+        调用 stop() 后不再提交新任务，已在执行的请求结束后即返回。
+        """
+        items = list(items)
+        window = max(1, workers) * 2
+        next_index = 0
+        pending = {}
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            while pending or next_index < len(items):
+                while self.is_running and next_index < len(items) and len(pending) < window:
+                    future = executor.submit(func, items[next_index])
+                    pending[future] = next_index
+                    next_index += 1
+                if not pending:
+                    break
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self.log(f"任务执行失败: {items[index]} - {str(e)}")
+                        result = None
+                    yield index, items[index], result
 
     def stop(self):
         """停止处理"""
         self.is_running = False
+        self._stop_event.set()
         self.log("正在停止处理...")
 
     def parse_fc2_id_from_url(self, text):
         """从URL页面内容解析FC2番号"""
-        ids = []
-        try:
-            pattern_card = re.compile(r'<div class="c-cntCard-110-f">.*?<a href="/article/(\d+)/"', re.S)
-            ids.extend(re.findall(pattern_card, text or ''))
-        except Exception:
-            pass
-        if not ids:
-            try:
-                pattern_any = re.compile(r'/article/(\d+)/')
-                ids.extend(re.findall(pattern_any, text or ''))
-            except Exception:
-                pass
-        seen = set()
-        ordered = []
-        for item in ids:
-            if item not in seen:
-                seen.add(item)
-                ordered.append(item)
-        return ordered
-
-    def get_fc2_ids_from_url(self, url, progress_callback=None):
-        """从FC2用户页面抓取所有番号"""
+        return fc2_parser.listing_ids(text)
+
+    def _parse_listing(self, html, url):
+        """解析作品列表页（单次扫描）：页面类型、番号、当前页、下一页与末页"""
+        return fc2_parser.parse_listing(html, url)
+
+    def _fetch_listing_page(self, url, page):
+        """获取并解析列表第 page 页，失败返回 None"""
+        # 规范化分页参数，避免简单字符串拼接导致URL异常
+        page_url = self._set_url_query_param(url, 'page', page if page > 1 else None)
+        # 列表页随新作品上架而变化，每次都向服务器确认（未变化时返回 304）
+        result = self.fetch_page(page_url, max_age=0)
+        if not result.text:
+            return None
+        if result.unchanged:
+            self.log(f"第 {page} 页未变化，使用缓存的解析结果")
+        return self._parse_cached(page_url, result, lambda h: self._parse_listing(h, page_url))
+
+    def _collect_listing_ids(self, page, page_ids, known, all_ids):
+        """
+        将一页的番号加入 all_ids 并输出日志；增量模式下剔除已知番号。
+        返回本页新增番号，整页均为已知番号时返回 None。
+        """
+        self.log(f"第 {page} 页解析到 {len(page_ids)} 个番号")
+        if known:
+            new_ids = [fc2_id for fc2_id in page_ids if fc2_id not in known]
+            if page_ids and not new_ids:
+                return None
+            page_ids = new_ids
+            self.log(f"第 {page} 页新增 {len(page_ids)} 个番号")
+
+        if page_ids:
+            all_ids.extend(page_ids)
+            preview = ", ".join(page_ids[:10])
+            suffix = ' ...' if len(page_ids) > 10 else ''
+            self.log(f'番号预览: {preview}{suffix}')
+        else:
+            self.log('× 本页未解析到任何番号')
+        return page_ids
+
+    def _prefetch_listing_pages(self, url, last_page, all_ids, progress_callback=None):
+        """
+        并发获取第 2 页至末页（受站点限速约束），按页码顺序合并番号。
+        返回成功获取的页数。
+        """
+        pages = list(range(2, last_page + 1))
+        workers = min(self.get_max_workers(), 4)
+        self.log(f"共 {last_page} 页，使用 {workers} 个线程并发获取其余页面")
+
+        parsed_pages = {}
+        for _, page, parsed in self.run_bounded(lambda p: self._fetch_listing_page(url, p), pages, workers):
+            parsed_pages[page] = parsed
+            if progress_callback:
+                progress_callback(len(parsed_pages) + 1, last_page, len(all_ids))
+
+        fetched = 0
+        for page in pages:
+            parsed = parsed_pages.get(page)
+            if parsed is None:
+                if page in parsed_pages:
+                    self.log(f"× 第 {page} 页获取失败，跳过")
+                continue
+            fetched += 1
+            self._collect_listing_ids(page, parsed['ids'], None, all_ids)
+        return fetched
+
+    def get_fc2_ids_from_url(self, url, progress_callback=None, incremental=False):
+        """
+        从FC2用户页面抓取所有番号。
+        incremental=True 时只收集以往未见过的番号：列表按日期倒序，遇到整页均为已知番号即停止翻页，
+        新番号追加到 list.txt，返回值也只包含新番号。
+        """
         self.log(f"开始从URL抓取番号: {url}")
         all_ids = []
+        metrics_since = self.metrics.snapshot()
 
-        fc2url = 'https://adult.contents.fc2.com'
+        fc2url = self.base_url('fc2')
+        rebased = rebase_url(url, 'fc2', fc2url)
+        if rebased != url:
+            url = rebased
+            self.log(f'→ 已改为自定义 FC2 地址：{url}')
         if fc2url not in url:
             self.log("× 输入有误,请输入正确的FC2网址")
             return []
 
         try:
-            if re.match(r'^https://adult\.contents\.fc2\.com/users/[^/]+/?$', url):
+            if re.match('^' + re.escape(fc2url) + r'/users/[^/]+/?$', url):
                 url = url.rstrip('/') + '/articles?sort=date&order=desc'
                 self.log('→ 已自动识别用户主页，改为作品列表页：' + url)
         except Exception:
             pass
 
+        download_path = self.read_config_value('下载设置', 'Download_path', './Downloads/')
+        cache = self.open_cache(download_path)
+        cache_since = cache.snapshot() if cache is not None else None
+
+        # 以去掉分页参数的列表页地址区分不同卖家/筛选条件
+        source = self._set_url_query_param(url, 'page', None)
+        known = set()
+        if incremental:
+            store = self.open_store(download_path)
+            if store.listing_complete(source):
+                known = store.known_listing_ids(source)
+            if not known:
+                self.log('增量抓取：该页面尚无完整抓取记录，将完整抓取一次')
+            else:
+                self.log(f'增量抓取：已记录 {len(known)} 个番号，遇到整页已知番号即停止')
+                query = dict(parse_qsl(urlparse(url).query))
+                if query.get('sort') != 'date' or query.get('order') != 'desc':
+                    self.log('！当前列表不是按日期倒序（sort=date&order=desc），增量抓取可能遗漏番号')
+
         self.is_running = True
+        self._stop_event.clear()
         i = 1
         n = 1
         page_count = 0
+        # 只有未中断、没有失败页的抓取才作为增量抓取的基准
+        complete = False
 
         while i <= n and self.is_running:
             try:
-                # 规范化分页参数，避免简单字符串拼接导致URL异常
-                page_url = self._set_url_query_param(url, 'page', i if i > 1 else None)
-
                 self.log(f"正在获取第 {i} 页...")
-                html = self.requests_web(page_url)
-
-                if not html:
+                parsed = self._fetch_listing_page(url, i)
+                if parsed is None:
                     self.log(f"× 第 {i} 页获取失败，跳过")
                     break
 
-                # 检测并记录页面类型
-                page_type = self.detect_fc2_page_type(html, page_url)
-                self.log(f"页面类型: {page_type}")
-
-                page_ids = self.parse_fc2_id_from_url(html)
-                self.log(f"第 {i} 页解析到 {len(page_ids)} 个番号")
+                self.log(f"页面类型: {parsed['page_type']}")
+                page_count += 1
+                page_ids = self._collect_listing_ids(i, parsed['ids'], known, all_ids)
+                if page_ids is None:
+                    self.log(f"第 {i} 页均为已知番号，增量抓取结束")
+                    complete = True
+                    break
 
-                if page_ids:
-                    all_ids.extend(page_ids)
-                    preview = ", ".join(page_ids[:10])
-                    suffix = ' ...' if len(page_ids) > 10 else ''
-                    self.log(f'番号预览: {preview}{suffix}')
-                else:
-                    self.log('× 本页未解析到任何番号')
+                current_page = parsed['current_page']
+                next_page = parsed['next_page']
+                last_page = parsed.get('last_page', 0)
+                self.log(f'当前页: {current_page}, 下一页: {next_page}, 末页: {last_page}')
+                if not parsed.get('pager_ok', True):
+                    # 分页区块不可信（结构变化、被截断或超时），其末页同样不可信，不再并发预取其余页面
+                    self.log('！未能识别分页结构（页面结构可能已变化或分页过大），不再继续翻页')
+                    break
 
-                current_page = self.fc2_get_current_page(html)
-                next_page = self.fc2_get_next_page(html)
-                self.log(f'当前页: {current_page}, 下一页: {next_page}')
+                # 完整抓取且已知总页数：其余页并发获取，不再逐页发现下一页
+                if i == 1 and not known and last_page > 1:
+                    prefetched = self._prefetch_listing_pages(url, last_page, all_ids, progress_callback)
+                    page_count += prefetched
+                    complete = prefetched == last_page - 1
+                    break
 
                 if next_page and next_page > i:
                     n = next_page
                     i += 1
                 else:
+                    complete = True
                     break
 
-                page_count += 1
-
                 if progress_callback:
                     progress_callback(i, n, len(all_ids))
 
-                time.sleep(1)
-
             except Exception as e:
                 self.log(f"抓取第 {i} 页时出错: {str(e)}")
                 break
 
         self.log(f"抓取完成！共获取 {len(all_ids)} 个番号，来自 {page_count} 页")
+        if self.cache is not None:
+            self.log(f"响应缓存: {self.cache.summary(cache_since)}")
+        if self.archive is not None:
+            self.log(f"HTTP存档: {self.archive.summary()}")
+        self.dump_metrics(download_path, metrics_since, '抓取番号')
 
-        download_path = self.read_config_value('下载设置', 'Download_path', './Downloads/')
+        try:
+            store = self.open_store(download_path)
+            store.mark_listed(all_ids)
+            if complete and self.is_running:
+                store.add_listing_ids(source, all_ids)
+            else:
+                self.log('抓取未完整完成（已停止或有页面获取失败），本次结果不作为增量抓取的基准')
+        except Exception as e:
+            self.log(f"写入结果库失败: {str(e)}")
         try:
             os.makedirs(download_path, exist_ok=True)
             list_file = os.path.join(download_path, 'list.txt')
-            with open(list_file, 'w', encoding='utf-8') as f:
+            # 增量模式仅追加新番号，完整抓取则重写列表
+            with open(list_file, 'a' if incremental else 'w', encoding='utf-8') as f:
                 for fc2_id in all_ids:
                     f.write(f"FC2-PPV-{fc2_id}\n")
-            self.log(f"番号列表已保存到: {list_file}")
+            if incremental:
+                self.log(f"新增 {len(all_ids)} 个番号已追加到: {list_file}")
+            else:
+                self.log(f"番号列表已保存到: {list_file}")
         except Exception as e:
             self.log(f"保存番号列表失败: {str(e)}")
 
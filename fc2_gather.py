@@ -4,6 +4,9 @@
 #version = 'v0.01'
 
 import requests, os, sys, time, re, threading
+import asyncio
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from configparser import RawConfigParser
 from traceback import format_exc
 try:
@@ -15,6 +18,10 @@ import argparse
 import socket
 import urllib3
 from urllib3.util.retry import Retry
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse, quote_plus
+import fc2_parser
+from fc2_async import AsyncHttpClient
+from fc2_core import HostRateLimiter, ResultStore, CheckpointJournal, BatchWriter, HttpArchive, MetricsRegistry, base_url_from_config, rebase_url, site_of, store_key, STATUS_FOUND, STATUS_NO_MAGNET, STATUS_ERROR, ARCHIVE_REPLAY
 
 #读取&初始化配置文件
 def read_config():
@@ -39,7 +46,7 @@ def read_config():
             # 创建文件夹
             if not os.path.exists(download_path):
                 os.makedirs(download_path)
-            return (proxy, download_path, max_dl, max_retry, auto_proxy, verify_ssl)
+            return (proxy, download_path, max_dl, max_retry, auto_proxy, verify_ssl, config_settings)
         except:
             print(format_exc())
             print('× 无法读取 config.ini。如果这是旧版本的配置文件，请删除后重试。\n')
@@ -69,10 +76,50 @@ Download_path = ./Downloads/
 # 默认线程2，小量数据不建议修改，多线程容易报502，建议线程 n/30
 Max_dl = 2
 
+# 获取磁力的方式
+# 线程：Max_dl 个线程从共享队列领取番号；异步：一个线程内 Max_dl 个协程同时请求，并发数可远大于线程数
+# （异步方式不支持 PAC 与 SOCKS 代理，遇到时自动改用线程）
+Engine = 线程
+
 # 下载失败重试数 
 # 若网络不稳定、丢包率或延迟较高，可适当增加失败重试数 
 # 避免晚上网络高峰期爬取大量数据，容易报错，也会增加服务器负担
-Max_retry = 3'''
+Max_retry = 3
+
+# 按站点限速（令牌桶），所有线程共享
+# Rate_* 为每秒请求数，Burst_* 为允许的突发请求数；Rate 设为 0 表示不限速
+Rate_fc2 = 2
+Burst_fc2 = 4
+Rate_sukebei = 2
+Burst_sukebei = 4
+
+# 流式读取：是：搜索磁力时读到所需内容即停止下载页面剩余部分；否：读取完整页面
+Stream = 是
+
+# 磁力排序方式：做种 / 下载 / 大小 / 默认（页面顺序）；每个番号保留前 Magnet_top 个，0 为全部
+Magnet_rank = 做种
+Magnet_top = 1
+
+# 磁力去重：是：按信息哈希跨批次去重，以往已输出过的种子不再写入 magnet.txt；否：每次全部输出
+Dedupe = 是
+
+# 跳过已有磁力：是：结果库中已有磁力的番号不再重新搜索，导出时直接使用库中的结果；否：全部重新搜索
+Skip_found = 否
+
+# sukebei 合并查询：每次搜索合并的番号数，按结果标题把结果分配给各番号，无法确定的番号再单独查询；1 为逐个查询
+Search_batch = 1
+
+# 站点地址，留空为正式站点；压测时可指向本地模拟服务器（python fc2_stub_server.py），如 http://127.0.0.1:8765
+FC2_base_url =
+Sukebei_base_url =
+
+# HTTP 存档：关闭；录制：保存所有请求的响应；回放：只从存档返回响应，不访问网络（用于离线重现与基准测试）
+Http_archive = 关闭
+# HTTP 存档文件，留空为下载目录下的 http_archive.db
+Http_archive_file =
+
+# 请求指标：每次运行写出下载目录下的 metrics.json；端口大于 0 时在本地提供 /metrics（Prometheus）与 /metrics.json
+Metrics_port = 0'''
         txt = open("config.ini", 'a', encoding="utf-8")
         txt.write(context)
         txt.close()
@@ -338,34 +385,26 @@ def _browser_headers(url: str):
         'Connection': 'keep-alive',
         'Upgrade-Insecure-Requests': '1',
     }
-    # 针对 FC2 添加 Referer/Origin
+    # 针对 FC2/sukebei 添加 Referer/Origin
     try:
-        if 'adult.contents.fc2.com' in url:
-            headers['Referer'] = 'https://adult.contents.fc2.com/'
-            headers['Origin'] = 'https://adult.contents.fc2.com'
-        elif 'sukebei.nyaa.si' in url:
-            headers['Referer'] = 'https://sukebei.nyaa.si/'
-            headers['Origin'] = 'https://sukebei.nyaa.si'
+        base = base_urls.get(site_of(url))
+        if base:
+            headers['Referer'] = base + '/'
+            headers['Origin'] = base
     except Exception:
         pass
     return headers
 
 def fc2_get_current_page(txt):#获当前页码
-    pattern = re.compile('<span class="items" aria-selected="true">([0-9]*)</span>', re.S)
-    keys = re.findall(pattern, txt)
-    if not keys==[]:
-        return int(keys[0])
+    return fc2_parser.current_page(txt)
 
 def fc2_get_next_page(txt):#获取下一页
-    pattern = re.compile('<span class="items" aria-selected="true">.*?</span>.*?<a data-pjx="pjx-container" data-link-name="pager".*?href=".*?&page=([0-9]*)" class="items">.*?<', re.S)
-    keys = re.findall(pattern, txt)
-    if not keys==[]:
-        return int(keys[0])
-    else:return 0
-
-# 获取网页数据
-def requests_web(url):
+    return fc2_parser.next_page(txt)
+
+# 获取网页数据；stop 为正则时流式读取，读到 stop 即停止下载剩余内容
+def requests_web(url, stop=None):
     headers = _browser_headers(url)
+    site = site_of(url)
     timeout_seconds = 15  # 默认超时，可后续从配置扩展
     attempts = 1
     try:
@@ -378,16 +417,18 @@ def requests_web(url):
         # 带退避的多次尝试（会话使用代理/自动代理）
         for i in range(attempts):
             try:
-                response = session.get(url, headers=headers, timeout=timeout_seconds, verify=_is_true(verify_ssl))
-                response.encoding = 'utf-8'
+                # 响应体也在循环内读取，读取中途断开（IncompleteRead 等）同样重试
+                response, text = fetch_body(session, url, headers, timeout_seconds, stop)
                 break
             except Exception as e:
+                metrics.add(site, 'errors', key=type(e).__name__)
                 if i == attempts - 1:
                     print('[调试] 代理路径最终失败: ' + type(e).__name__)
                     print(format_exc())
                     raise
                 # 指数退避，最多 5 秒
                 backoff = min(2 ** i, 5)
+                metrics.add(site, 'retries')
                 print(f'→ 第 {i+1}/{attempts} 次失败，退避 {backoff}s 后重试：{type(e).__name__}')
                 time.sleep(backoff)
     except:
@@ -395,16 +436,20 @@ def requests_web(url):
         try:
             # 代理失败时优雅降级直连重试一次
             print('→ 尝试直连重试一次...')
+            metrics.add(site, 'direct_fallbacks')
             direct = requests.Session()
             # 明确关闭环境代理，确保是真正直连
             direct.trust_env = False
             adapter = requests.adapters.HTTPAdapter(max_retries=Retry(total=1, backoff_factor=0))
             direct.mount('http://', adapter)
             direct.mount('https://', adapter)
+            if archive is not None:
+                # 直连同样经过存档：录制时保存响应，回放时不访问网络
+                archive.mount(direct)
             _debug_snapshot(url, 'direct-retry')
-            response = direct.get(url, headers=headers, timeout=timeout_seconds, verify=_is_true(verify_ssl))
-            response.encoding = 'utf-8'
+            response, text = fetch_body(direct, url, headers, timeout_seconds, stop)
         except:
+            metrics.add(site, 'errors', key=sys.exc_info()[0].__name__)
             print(format_exc())
             print('× 网络连接异常且代理与直连均失败')
             print('× 可能原因：网络防火墙、地区屏蔽、证书问题或系统代理不可用')
@@ -416,8 +461,56 @@ def requests_web(url):
         print('x 连接错误：'+str(response.status_code))
         return None
         sys.exit()
-    else:
-        return response.text
+    return text
+
+#限速后发送一次请求并读取响应体，返回 (响应, 文本)；非 200 时不读取响应体，文本为 None；出错时抛出异常
+def fetch_body(sess, url, headers, timeout_seconds, stop=None):
+    site = site_of(url)
+    metrics.add(site, 'throttle_seconds', rate_limiter.acquire(url))
+    started = time.perf_counter()
+    try:
+        response = sess.get(url, headers=headers, timeout=timeout_seconds, verify=_is_true(verify_ssl), stream=stop is not None)
+    except Exception:
+        # 未收到响应的请求也计数；读取响应体时出错的请求已由 record_response 计数
+        metrics.add(site, 'requests')
+        raise
+    metrics.record_response(url, response, time.perf_counter() - started)
+    response.encoding = 'utf-8'
+    if response.status_code != 200:
+        response.close()
+        return response, None
+    if stop is not None:
+        return response, read_until(response, stop)
+    text = response.text
+    metrics.add(site, 'bytes', MetricsRegistry.response_size(response))
+    return response, text
+
+#按块读取响应体，读到 stop 后关闭连接，返回已读取的内容
+def read_until(response, stop):
+    scanner = fc2_parser.StreamScanner(stop)
+    try:
+        for chunk in response.iter_content(chunk_size=16 * 1024, decode_unicode=True):
+            if scanner.feed(chunk):
+                break
+    finally:
+        metrics.add(site_of(response.url), 'bytes', MetricsRegistry.response_size(response))
+        response.close()
+    return scanner.text
+
+#磁力排序方式（Magnet_rank）与每个番号保留的数量（Magnet_top，0 为全部）
+def magnet_rank():
+    policy = config_settings.get('下载设置', 'Magnet_rank', fallback='做种').strip()
+    if policy not in fc2_parser.RANK_POLICIES:
+        policy = '做种'
+    try:
+        top = max(0, int(config_settings.get('下载设置', 'Magnet_top', fallback='1')))
+    except ValueError:
+        top = 1
+    return policy, top
+
+#流式读取开关（Stream=是）：开启时返回停止条件，否则读取完整页面
+def stream_stop(stop):
+    return stop if _is_true(config_settings.get('下载设置', 'Stream', fallback='是')) else None
 
 def _test_single_url(url: str):
     print(f'→ 测试目标：{url}')
@@ -505,35 +598,24 @@ def diagnose_network(test_urls):
 
 #获取番号正则
 def parse_fc2id(txt):
-    # 兼容多种版式：优先卡片结构，其次通用 /article/{id}/ 链接扫描
-    ids = []
-    try:
-        pattern_card = re.compile(r'<div class="c-cntCard-110-f">.*?<a href="/article/([0-9]+)/"', re.S)
-        ids.extend(re.findall(pattern_card, txt or ''))
-    except Exception:
-        pass
-    if not ids:
-        try:
-            pattern_any = re.compile(r'/article/([0-9]+)/')
-            ids.extend(re.findall(pattern_any, txt or ''))
-        except Exception:
-            pass
-    # 去重并保持顺序
-    seen = set()
-    for item in ids:
-        if item not in seen:
-            seen.add(item)
-            yield item
+    # 兼容多种版式：优先卡片结构，其次通用 /article/{id}/ 链接扫描（去重并保持顺序）
+    return fc2_parser.listing_ids(txt)
 
 #获取磁力正则
 def parse_magnet(html):
-    pattern = re.compile('<a href="magnet:\?xt=(.*?)&amp;dn=', re.S)
-    urls = re.findall(pattern, html)
-    if not urls==[]:
-        return 'magnet:?xt='+urls[0]
+    return fc2_parser.first_magnet(html)
+
+#设置列表页URL中的页码（替换已有的 page 参数，避免重复拼接）
+def set_page(url, page):
+    parsed = urlparse(url)
+    query = [(k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if k != 'page']
+    query.append(('page', str(page)))
+    return urlunparse(parsed._replace(query=urlencode(query)))
 
 #获取每页番号并导出txt
 def get_fc2id(url):
+    url = rebase_url(url, 'fc2', base_urls['fc2'])
+    metrics_since = metrics.snapshot()
     clean_list('list.txt')
     i=1;n=1
     while i<=n:
@@ -542,7 +624,9 @@ def get_fc2id(url):
         if not html:
             print('× 页面获取失败，跳过解析与写入')
             break
-        f2ids = list(parse_fc2id(html))
+        # 单次扫描同时取出番号与下一页
+        listing = fc2_parser.parse_listing(html, url)
+        f2ids = listing['ids']
         print(f'[调试] 解析到番号数量: {len(f2ids)}')
         if f2ids:
             try:
@@ -553,45 +637,283 @@ def get_fc2id(url):
                 pass
             for num in f2ids:
                 write_to_file('list.txt', 'FC2 '+str(num))
+            store.mark_listed(f2ids)
         else:
             print('× 未解析到任何番号，可能是页面结构变化、需要登录或地区限制')
         i=i+1
-        n=fc2_get_next_page(html)
+        n=listing['next_page']
         print(f'[调试] 下一页页码: {n}')
+        if not listing['pager_ok']:
+            print('！未能识别分页结构（页面结构可能已变化或分页过大），不再继续翻页')
         if n:
-            url=url+'&page='+str(n)
+            url=set_page(url, n)
+    close_writer('list.txt')
+    print_archive_summary()
+    dump_metrics('抓取番号', metrics_since)
     print('获取番号列表完成，数据已存到' + download_path + 'list.txt文件中')
 
-#获取磁力链接并导出txt
-def get_magnet(start,stop):
-    for i in range(start,stop):
-        url = 'https://sukebei.nyaa.si/?f=0&c=0_0&q=' + idlist[i]+'&s=downloads&o=desc'
-        html = requests_web(url)
-        if html is not None:
+#获取磁力链接：线程从共享队列领取番号，直到队列取空
+def get_magnet(worker, tasks):
+    while True:
+        try:
+            label = tasks.get_nowait()
+        except queue.Empty:
+            return
+        try:
+            lookup_magnet(label)
+        except Exception:
+            print(format_exc())
+            print('× 获取失败，写入结果库 ====> ' + label.strip())
+            record_result(label, STATUS_ERROR)
+        finally:
+            report_progress(worker)
+            tasks.task_done()
+
+#记录并输出进度：每个线程/任务槽的完成数与总进度
+def report_progress(worker):
+    with progress_lock:
+        progress['done'] += 1
+        progress[worker] = progress.get(worker, 0) + 1
+        print(f"[{worker}] 已完成 {progress[worker]} 个，总进度 {progress['done']}/{progress['total']}")
+
+#搜索单个番号的磁力并记录结果
+def lookup_magnet(label):
+    url, stop = magnet_search(label)
+    record_search(label, requests_web(url, stop=stop))
+
+#单个番号的搜索地址与流式读取的停止条件
+def magnet_search(label):
+    url = base_urls['sukebei'] + '/?f=0&c=0_0&q=' + label+'&s=downloads&o=desc'
+    policy, top = magnet_rank()
+    # 只取第一个磁力时读到即停止下载，否则读完结果表格后按行排序
+    stop = fc2_parser.RE_MAGNET_XT if policy == '默认' and top == 1 else fc2_parser.STOP_SEARCH_RESULTS
+    return url, stream_stop(stop)
+
+#由搜索页记录单个番号的结果，html 为 None 表示请求失败
+def record_search(label, html):
+    policy, top = magnet_rank()
+    if html is not None:
+        magnets = row_magnets(fc2_parser.parse_result_rows(html), policy, top)
+        if not magnets:
             magnet = parse_magnet(html)
-            if magnet is not None:
-                f = open(download_path + 'magnet.txt', 'a', encoding='UTF-8')
-                mu.acquire()
-                print('已找到磁力，数据写入magnet.txt文件中 ====> ' + idlist[i])
-                f.write(str(magnet) + '\n')
-                time.sleep(1)
-                f.close()
-                mu.release()
-            else:
-                f = open(download_path + 'no_magnet.txt', 'a', encoding='UTF-8')
-                mu.acquire()
-                print('× 没有磁力，失败列表写入no_magnet.txt ====> ' + idlist[i])
-                f.write(idlist[i])
-                time.sleep(1)
-                f.close()
-                mu.release()
+            magnets = [magnet] if magnet is not None else []
+        record_magnets(label, magnets)
+    else:
+        print('× 连接失败，写入结果库 ====> ' + label.strip())
+        record_result(label, STATUS_ERROR)
+
+#异步引擎：Max_dl 个协程从共享的番号迭代器领取番号（空闲即取下一个），全部完成后返回
+async def get_magnet_async(labels, limit, proxy):
+    client = AsyncHttpClient(proxy, _is_true(verify_ssl), attempts=max_retry_count(),
+                             rate_limiter=rate_limiter, metrics=metrics, archive=archive)
+    # 经代理失败时与线程引擎一样直连重试一次
+    direct = AsyncHttpClient('', _is_true(verify_ssl), attempts=1, rate_limiter=rate_limiter,
+                             metrics=metrics, archive=archive) if proxy else None
+    labels = iter(labels)
+
+    async def worker(name):
+        for label in labels:
+            try:
+                await lookup_magnet_async(label, client, direct)
+            except Exception:
+                print(format_exc())
+                print('× 获取失败，写入结果库 ====> ' + label.strip())
+                record_result(label, STATUS_ERROR)
+            finally:
+                report_progress(name)
+    try:
+        await asyncio.gather(*(worker('任务' + str(i + 1)) for i in range(limit)))
+    finally:
+        await client.close()
+        if direct is not None:
+            await direct.close()
+
+#异步搜索单个番号的磁力并记录结果
+async def lookup_magnet_async(label, client, direct=None):
+    url, stop = magnet_search(label)
+    try:
+        status, html = await client.get(url, _browser_headers(url), stop)
+    except Exception as e:
+        if direct is None:
+            raise
+        print(f'→ 代理请求失败（{type(e).__name__}），尝试直连重试一次...')
+        metrics.add(site_of(url), 'direct_fallbacks')
+        status, html = await direct.get(url, _browser_headers(url), stop)
+    if status != 200:
+        print('x 连接错误：'+str(status))
+    record_search(label, html)
+
+#读取获取磁力的方式（Engine）：线程 / 异步
+def magnet_engine():
+    engine = config_settings.get('下载设置', 'Engine', fallback='线程').strip()
+    return '异步' if engine in ('异步', 'async', 'asyncio') else '线程'
+
+#异步引擎使用的代理：直连为空字符串；会话使用 PAC 或 SOCKS 代理时返回 None（异步客户端不支持）
+def async_proxy():
+    if PACSession is not None and isinstance(session, PACSession):
+        try:
+            if session.get_pac() is not None:
+                return None
+        except Exception:
+            return None
+    proxies = getattr(session, 'proxies', None) or {}
+    proxy = proxies.get('https') or proxies.get('http') or ''
+    return proxy if AsyncHttpClient.supports_proxy(proxy) else None
+
+#失败重试次数（Max_retry）
+def max_retry_count():
+    try:
+        return max(1, int(max_retry))
+    except Exception:
+        return 1
+
+#按排序方式取结果行的磁力（只保留信息哈希部分）
+def row_magnets(rows, policy, top):
+    rows = fc2_parser.rank_rows(rows, policy, top)
+    return ['magnet:?xt=urn:btih:' + row['infohash'] for row in rows if row['infohash']]
+
+#记录单个番号的搜索结果（有无磁力）
+def record_magnets(label, magnets):
+    if magnets:
+        print('已找到磁力，写入结果库 ====> ' + label.strip())
+        record_result(label, STATUS_FOUND, magnets)
+    else:
+        print('× 没有磁力，写入结果库 ====> ' + label.strip())
+        record_result(label, STATUS_NO_MAGNET)
+
+#合并查询一组番号 [(番号原文, 番号)]：按结果标题分配结果行，返回需要单独查询的番号原文
+def lookup_batch(chunk):
+    labels = [label for label, _ in chunk]
+    fc2_ids = [fc2_id for _, fc2_id in chunk]
+    url = base_urls['sukebei'] + '/?f=0&c=0_0&q=' + quote_plus(fc2_parser.batch_query(fc2_ids)) + '&s=downloads&o=desc'
+    html = requests_web(url, stop=stream_stop(fc2_parser.STOP_SEARCH_RESULTS))
+    if html is None:
+        return labels
+    rows = fc2_parser.parse_result_rows(html)
+    if not rows and parse_magnet(html):
+        # 有磁力却无法按行解析（页面结构变化），全部单独查询
+        return labels
+    attributed = fc2_parser.attribute_rows(rows, fc2_ids)
+    # 结果不足一页时，未出现在结果中的番号即为无磁力
+    complete = len(rows) < fc2_parser.SUKEBEI_PAGE_SIZE
+    policy, top = magnet_rank()
+    rest = []
+    for label, fc2_id in chunk:
+        if fc2_id in attributed or complete:
+            record_magnets(label, row_magnets(attributed.get(fc2_id, []), policy, top))
+            report_progress('合并')
+        else:
+            rest.append(label)
+    return rest
+
+#合并查询（Search_batch 大于 1 时）：每 batch 个番号一次搜索，返回仍需单独查询的番号原文
+def search_batches(labels, batch):
+    rest = []
+    chunk = []
+    chunks = []
+    for label in labels:
+        fc2_id = fc2_parser.label_id(label)
+        if fc2_id:
+            chunk.append((label, fc2_id))
+            if len(chunk) == batch:
+                chunks.append(chunk)
+                chunk = []
         else:
-            mu.acquire()
-            write_to_file('error.txt',idlist[i].replace('\n','')+'--连接失败')
-            time.sleep(1)
-            mu.release()
+            rest.append(label)
+    if chunk:
+        chunks.append(chunk)
+    with ThreadPoolExecutor(max_workers=max(1, int(max_dl))) as executor:
+        for labels_left in executor.map(lookup_batch, chunks):
+            rest.extend(labels_left)
+    print(f'→ 合并查询：{len(chunks)} 次搜索确定 {len(labels) - len(rest)} 个番号，剩余 {len(rest)} 个单独查询')
+    return rest
 
+#合并查询每次搜索的番号数（Search_batch），1 为逐个查询
+def search_batch():
+    try:
+        return max(1, int(config_settings.get('下载设置', 'Search_batch', fallback='1')))
+    except ValueError:
+        return 1
+
+#记录单个番号结果：结果库与断点日志都由写入线程批量写入，断点日志约每秒刷盘一次（中断时最后不足一秒的番号会重新处理）
+def record_result(label, status, magnets=None):
+    store.record(label, status, magnets=magnets)
+    journal.append(label.strip(), status, magnets=magnets)
 
+#获取磁力，resume 为真时跳过断点日志中已完成的番号
+def run_get_magnet(resume=False):
+    global idlist
+    full_list = read_list('list.txt')
+    if not full_list:
+        print('× 没找到番号列表list.txt文件！请重新获取番号列表！')
+        return
+    if resume:
+        done = journal.resolved()
+        for line in full_list:
+            record = done.get(store_key(line))
+            if record:
+                store.record(line, record['status'], magnets=record['magnets'])
+        idlist = [line for line in full_list if store_key(line) not in done]
+        print(f'→ 断点续传：跳过 {len(full_list) - len(idlist)} 个已完成的番号，剩余 {len(idlist)} 个')
+    else:
+        journal.clear()
+        clean_list('magnet.txt')
+        clean_list('no_magnet.txt')
+        clean_list('error.txt')
+        idlist = full_list
+    if _is_true(config_settings.get('下载设置', 'Skip_found', fallback='否')) and idlist:
+        # 一次索引查询找出结果库中已有磁力的番号，导出时直接使用库中的结果
+        found = store.ids_with_magnet(idlist)
+        if found:
+            idlist = [line for line in idlist if store_key(line) not in found]
+            print(f'→ 跳过 {len(found)} 个结果库中已有磁力的番号（Skip_found），剩余 {len(idlist)} 个')
+    progress.clear()
+    progress.update(done=0, total=len(idlist))
+    started = time.time()
+    metrics_since = metrics.snapshot()
+    if search_batch() > 1 and idlist:
+        idlist = search_batches(idlist, search_batch())
+    if magnet_engine() == '异步':
+        creta_tasks()
+    else:
+        creta_thread()
+    elapsed = time.time() - started
+    # 由结果库导出 magnet.txt / no_magnet.txt / error.txt
+    counts = store.export_txt(download_path, full_list, dedupe=_is_true(config_settings.get('下载设置', 'Dedupe', fallback='是')))
+    journal.clear()
+    print(f"找到磁力 {counts[STATUS_FOUND]} 个，无磁力 {counts[STATUS_NO_MAGNET]} 个，失败 {counts[STATUS_ERROR]} 个")
+    if counts.get('duplicates'):
+        print(f"去重：跳过 {counts['duplicates']} 个以往已输出过的磁力链接")
+    rate = progress['done'] / elapsed if elapsed > 0 else 0
+    # 实际请求数（含合并查询与重试）取自请求指标
+    sent = sum(stats['requests'] for stats in MetricsRegistry.delta(metrics_since, metrics.snapshot()).values())
+    request_rate = sent / elapsed if elapsed > 0 else 0
+    print(f"本次处理 {progress['done']} 个番号，用时 {elapsed:.1f} 秒，{rate:.2f} 番号/秒；"
+          f"发出 {sent} 个请求，{request_rate:.2f} 请求/秒")
+    print_archive_summary()
+    dump_metrics('获取磁力', metrics_since)
+    print('获取磁力完成，数据已存到' + download_path)
+
+
+
+#输出 HTTP 存档统计（启用 Http_archive 时）
+def print_archive_summary():
+    if archive is not None:
+        print('HTTP存档: ' + archive.summary())
+
+#写出本次运行的请求指标（metrics.json），并按站点输出请求数、重试、状态码与 p95 耗时
+def dump_metrics(task, since):
+    try:
+        report = metrics.dump(os.path.join(download_path, MetricsRegistry.FILENAME), since, task=task)
+    except Exception as e:
+        print('× 写入运行指标失败：' + str(e))
+        return
+    for site, stats in report['sites'].items():
+        if not stats['requests']:
+            continue
+        status = '，'.join(f'{code}×{count}' for code, count in sorted(stats['status'].items()) if count)
+        print(f"请求指标 {site}: 请求 {stats['requests']}，重试 {stats['retries']}，直连降级 {stats['direct_fallbacks']}，"
+              f"状态码 {status or '无'}，p95 {stats['latency']['p95']:g}s，限速等待 {stats['throttle_seconds']:.1f}s")
 
 #读取本地txt番号list
 def read_list(file):
@@ -609,51 +931,70 @@ def read_list(file):
         print('× 没找到番号列表list.txt文件！请重新获取番号列表！')
 
 
-#写入txt
+#写入txt：每个文件一个后台写入线程，按行数/时间批量追加，避免逐行打开文件
 def write_to_file(filename,txt):
-    filename=download_path+filename
+    with writers_lock:
+        writer = writers.get(filename)
+        if writer is None:
+            path = download_path + filename
+            writer = writers[filename] = BatchWriter(lambda lines: append_lines(path, lines))
+    writer.put(str(txt)+'\n')
+
+def append_lines(filename, lines):
     try:
-        print('开始写入数据 ====> ' + str(txt))
         with open(filename, 'a', encoding='UTF-8') as f:
-            f.write(txt+'\n')
-            f.close()
+            f.writelines(lines)
     except Exception:
         print('× 写入文件失败: ' + filename)
         print(format_exc())
+
+#写完剩余数据并关闭文件的写入线程
+def close_writer(filename):
+    with writers_lock:
+        writer = writers.pop(filename, None)
+    if writer is not None:
+        writer.close()
+
 #清空输出txt文件
 def clean_list(filename):
+    close_writer(filename)
     filename = download_path + filename
     print('× 清空txt数据 ===>'+filename)
     with open(filename, 'w', encoding='UTF-8') as f:
         f.truncate(0)
         f.close()
 
-#多线程，按线程数分组
+#异步方式（Engine=异步）：事件循环内并发请求，会话使用 PAC/SOCKS 代理时改用线程
+def creta_tasks():
+    proxy = async_proxy()
+    if proxy is None:
+        print('！异步方式不支持 PAC 与 SOCKS 代理，改用线程方式')
+        creta_thread()
+        return
+    asyncio.run(get_magnet_async(idlist, max(1, int(max_dl)), proxy))
+
+#多线程，共享任务队列：空闲线程立即领取下一个番号，全部完成后返回
 def creta_thread():
-    lmax = len(idlist)
-    remaider = lmax % int(max_dl)
-    number = int(lmax / int(max_dl))
-    offset = 0
+    tasks = queue.Queue()
+    for label in idlist:
+        tasks.put(label)
     for i in range(int(max_dl)):
-        if remaider > 0:
-            t = threading.Thread(target=get_magnet, args=(i * number + offset, (i + 1) * number + offset + 1))
-            remaider = remaider - 1
-            offset = offset + 1
-        else:
-            t = threading.Thread(target=get_magnet, args=(i * number + offset, (i + 1) * number + offset))
+        t = threading.Thread(target=get_magnet, args=('线程' + str(i + 1), tasks), daemon=True)
         t.start()
-        time.sleep(0.1)
+    tasks.join()
 
 #获取用户输出url，并简单判断合规
 def input_url():
     print('例如：https://adult.contents.fc2.com/users/yamasha/articles?sort=date&order=desc')
     while True:
         url = input("请输入需要抓取番号的网页：")
-        fc2url='https://adult.contents.fc2.com'
+        fc2url = base_urls['fc2']
+        # 设置了 FC2_base_url 时，正式站点的网址改为自定义地址下的同一页面
+        url = rebase_url(url, 'fc2', fc2url)
         if fc2url in url:
             # 若用户只输入了用户主页，自动补全为 articles 列表页
             try:
-                if re.match(r'^https://adult\.contents\.fc2\.com/users/[^/]+/?$', url):
+                if re.match('^' + re.escape(fc2url) + r'/users/[^/]+/?$', url):
                     url = url.rstrip('/') + '/articles?sort=date&order=desc'
                     print('→ 已自动识别用户主页，改为作品列表页：' + url)
             except Exception:
@@ -670,6 +1011,7 @@ def set_memu():
 --------------------
    1: 获取番号
    2: 获取磁力
+   3: 继续获取磁力（断点续传）
    q: Quit
 --------------------
 """
@@ -687,20 +1029,9 @@ def set_memu():
                         get_fc2id(target_url)
                         continue
                     elif cmd == '2':
-                        idlist = read_list('list.txt')
-                        if idlist is not None or idlist!=[]:
-                            clean_list('magnet.txt')
-                            clean_list('no_magnet.txt')
-                            clean_list('error.txt')
-                            creta_thread()
-                            while threading.active_count() != 1:
-                                pass
-                            else:
-                                print('获取磁力完成，数据已存到' + download_path)
-
-                        else:
-                            print('× 没找到番号列表list.txt文件！请重新获取番号列表！')
-
+                        run_get_magnet()
+                    elif cmd == '3':
+                        run_get_magnet(resume=True)
                     else:
                         print('× 输入有误，清输入菜单指定字符!')
             except:
@@ -711,7 +1042,7 @@ def set_memu():
             sys.exit()
 
 if __name__ == '__main__':
-    (proxy, download_path, max_dl, max_retry, auto_proxy, verify_ssl) = read_config()
+    (proxy, download_path, max_dl, max_retry, auto_proxy, verify_ssl, config_settings) = read_config()
     # 若关闭证书校验，抑制不安全证书警告
     try:
         if not _is_true(verify_ssl):
@@ -719,6 +1050,36 @@ if __name__ == '__main__':
     except Exception:
         pass
     session = build_session(auto_proxy, proxy, max_retry)
+    # 站点地址（FC2_base_url / Sukebei_base_url 可指向本地模拟服务器 fc2_stub_server.py）
+    base_urls = {site: base_url_from_config(config_settings, site) for site in ('fc2', 'sukebei')}
+    # 按站点令牌桶限速，替代原先写文件时持锁 sleep 的节流方式
+    rate_limiter = HostRateLimiter.from_config(config_settings)
+    # HTTP 录制/回放存档（Http_archive）：回放时不访问网络，也不限速
+    archive = HttpArchive.from_config(config_settings, download_path)
+    if archive is not None:
+        archive.mount(session)
+        if archive.mode == ARCHIVE_REPLAY:
+            rate_limiter = HostRateLimiter()
+        print(f'→ HTTP存档（{archive.mode}）: {archive.path}')
+    # 请求指标（按站点的请求数、状态码、重试、耗时直方图），Metrics_port>0 时提供 Prometheus 端点
+    metrics = MetricsRegistry()
+    try:
+        metrics_port = int(config_settings.get('下载设置', 'Metrics_port', fallback='0').strip() or 0)
+    except ValueError:
+        metrics_port = 0
+    if metrics_port > 0:
+        try:
+            metrics.serve(metrics_port)
+            print(f'→ 指标服务: http://127.0.0.1:{metrics_port}/metrics')
+        except OSError as e:
+            print(f'× 指标服务启动失败（端口 {metrics_port}）：{e}')
+    # 结果库（SQLite），txt 文件由其导出
+    store = ResultStore.open_in(download_path)
+    # 断点日志：中断后可通过菜单 3 继续
+    journal = CheckpointJournal.open_in(download_path)
+    # 输出txt的后台写入线程，按文件名区分
+    writers = {}
+    writers_lock = threading.Lock()
     print_proxy_status(auto_proxy, proxy, session)
 
     parser = argparse.ArgumentParser(description='FC2 Gather Utility')
@@ -733,6 +1094,7 @@ if __name__ == '__main__':
 
     if args.fetch_ids:
         get_fc2id(args.fetch_ids)
+        store.close()
         sys.exit(0)
 
     if args.diagnose:
@@ -744,6 +1106,11 @@ if __name__ == '__main__':
 
     target_url=''
     idlist = read_list("list.txt")
-    mu = threading.Lock()
-    set_memu()
+    # 获取磁力的进度统计，各线程共享
+    progress = {}
+    progress_lock = threading.Lock()
+    try:
+        set_memu()
+    finally:
+        store.close()
 
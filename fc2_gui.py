@@ -17,28 +17,37 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # 兼容 PyInstaller 单文件环境下的导入（fc2_core）
 try:
-    from fc2_core import FC2GatherCore
+    from fc2_core import FC2GatherCore, StagePipeline
 except ModuleNotFoundError:
     # 当模块未找到时，尝试从打包资源复制到临时路径并动态加载
     import importlib.util
     import shutil
     tmp_dir = os.path.join(os.getcwd(), "_runtime")
     os.makedirs(tmp_dir, exist_ok=True)
-    candidate_paths = []
-    # 可能的来源：当前目录、_MEIPASS、复制到当前目录的fc2_core.py
-    candidate_paths.append(os.path.join(os.getcwd(), "fc2_core.py"))
     base = getattr(sys, "_MEIPASS", None)
-    if base:
-        candidate_paths.append(os.path.join(base, "fc2_core.py"))
-    src = next((p for p in candidate_paths if os.path.exists(p)), None)
+
+    def _find_module_source(filename):
+        # 可能的来源：当前目录、_MEIPASS
+        candidate_paths = [os.path.join(os.getcwd(), filename)]
+        if base:
+            candidate_paths.append(os.path.join(base, filename))
+        return next((p for p in candidate_paths if os.path.exists(p)), None)
+
+    src = _find_module_source("fc2_core.py")
     if src:
+        # fc2_core 依赖 fc2_parser，一并复制到临时路径
+        for _name in ("fc2_parser.py", "fc2_core.py"):
+            _src = _find_module_source(_name)
+            _dst = os.path.join(tmp_dir, _name)
+            if _src and not os.path.exists(_dst):
+                shutil.copy2(_src, _dst)
+        sys.path.insert(0, tmp_dir)
         dst = os.path.join(tmp_dir, "fc2_core.py")
-        if not os.path.exists(dst):
-            shutil.copy2(src, dst)
         spec = importlib.util.spec_from_file_location("fc2_core", dst)
         mod = importlib.util.module_from_spec(spec)
         spec.loader.exec_module(mod)
         FC2GatherCore = mod.FC2GatherCore
+        StagePipeline = mod.StagePipeline
     else:
         raise
 
@@ -84,6 +93,28 @@ class FC2GatherGUI:
                 self.config.set('下载设置', 'Max_dl', '3')
                 self.config.set('下载设置', 'Max_retry', '3')
                 self.config.set('下载设置', 'VerifySSL', '否')
+                self.config.set('下载设置', 'Rate_fc2', '2')
+                self.config.set('下载设置', 'Burst_fc2', '4')
+                self.config.set('下载设置', 'Rate_sukebei', '2')
+                self.config.set('下载设置', 'Burst_sukebei', '4')
+                self.config.set('下载设置', 'Cache', '是')
+                self.config.set('下载设置', 'Cache_hours_fc2', '168')
+                self.config.set('下载设置', 'Cache_hours_sukebei', '12')
+                self.config.set('下载设置', 'Cache_size_mb', '200')
+                self.config.set('下载设置', 'Title_mode', '完整')
+                # Workers_fc2 / Workers_sukebei 不写入默认配置，未设置时按 Max_dl
+                self.config.set('下载设置', 'Stream', '是')
+                self.config.set('下载设置', 'Magnet_rank', '做种')
+                self.config.set('下载设置', 'Magnet_top', '1')
+                self.config.set('下载设置', 'Dedupe', '是')
+                self.config.set('下载设置', 'Search_batch', '1')
+                self.config.set('下载设置', 'Http_archive', '关闭')
+                self.config.set('下载设置', 'Http_archive_file', '')
+                self.config.set('下载设置', 'FC2_base_url', '')
+                self.config.set('下载设置', 'Sukebei_base_url', '')
+                self.config.set('下载设置', 'Metrics_port', '0')
+                self.config.set('下载设置', 'Skip_found', '否')
+                self.config.set('下载设置', 'Engine', '线程')
                 with open('config.ini', 'w', encoding='utf-8') as f:
                     self.config.write(f)
         except Exception as e:
@@ -160,6 +191,11 @@ class FC2GatherGUI:
         example_label = ttk.Label(self.tab1, text="示例：https://adult.contents.fc2.com/", 
                                  foreground='gray', font=('Arial', 9))
         example_label.pack(padx=10, pady=(0, 10))
+
+        # 增量抓取：只收集该页面以往未见过的新番号
+        self.incremental_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.tab1, text="增量抓取（只获取新上架的番号，追加到list.txt）",
+                        variable=self.incremental_var).pack(padx=10, pady=(0, 5), anchor='w')
         
         # 结果显示区域
         result_frame = ttk.LabelFrame(self.tab1, text="获取结果", padding=10)
@@ -233,6 +269,19 @@ class FC2GatherGUI:
         
         self.open_folder_btn = ttk.Button(control_frame, text="📂 打开下载目录", command=self.open_download_folder)
         self.open_folder_btn.pack(side='left')
+
+        # 断点续传：跳过上次中断前已完成的番号
+        self.resume_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(control_frame, text="断点续传", variable=self.resume_var).pack(side='left', padx=(10, 0))
+
+        # 标题获取方式：完整（下载作品页）/ 仅磁力 / 延迟（使用搜索结果标题，之后可补全）
+        ttk.Label(control_frame, text="标题:").pack(side='left', padx=(10, 0))
+        self.title_mode_var = tk.StringVar(value=self.config.get('下载设置', 'Title_mode', fallback='完整'))
+        ttk.Combobox(control_frame, textvariable=self.title_mode_var, values=('完整', '仅磁力', '延迟'),
+                     state='readonly', width=6).pack(side='left', padx=(5, 0))
+
+        self.fill_titles_btn = ttk.Button(control_frame, text="📝 补全标题", command=self.fill_missing_titles)
+        self.fill_titles_btn.pack(side='left', padx=(10, 0))
     
     def create_log_area(self):
         """创建日志区域"""
@@ -292,7 +341,8 @@ class FC2GatherGUI:
         
         def run_get_ids():
             try:
-                ids = self.core.get_fc2_ids_from_url(url, self.update_ids_progress)
+                ids = self.core.get_fc2_ids_from_url(url, self.update_ids_progress,
+                                                     incremental=self.incremental_var.get())
                 
                 # 显示结果
                 self.root.after(0, self.show_ids_result, ids)
@@ -399,7 +449,9 @@ class FC2GatherGUI:
                 # 重新加载配置
                 self.core.config = self.config
                 
-                results = self.core.process_fc2_list(input_data, self.update_progress)
+                results = self.core.process_fc2_list(input_data, self.update_progress,
+                                                     resume=self.resume_var.get(),
+                                                     title_mode=self.title_mode_var.get())
                 
                 # 完成处理
                 self.root.after(0, self.download_complete, results)
@@ -413,10 +465,43 @@ class FC2GatherGUI:
         self.download_thread.daemon = True
         self.download_thread.start()
     
-    def update_progress(self, value):
-        """更新进度"""
+    def fill_missing_titles(self):
+        """补全结果库中缺少标题的番号"""
+        if self.is_downloading:
+            return
+        self.is_downloading = True
+        self.start_btn.config(state='disabled')
+        self.fill_titles_btn.config(state='disabled')
+        self.stop_btn.config(state='normal')
+        self.progress_var.set(0)
+
+        def run_fill():
+            try:
+                self.core.config = self.config
+                self.core.fill_missing_titles(self.update_progress)
+            except Exception as e:
+                self.root.after(0, lambda: self.log(f"补全标题失败: {str(e)}"))
+            finally:
+                self.root.after(0, self.fill_titles_complete)
+
+        thread = threading.Thread(target=run_fill)
+        thread.daemon = True
+        thread.start()
+
+    def fill_titles_complete(self):
+        """补全标题完成"""
+        self.is_downloading = False
+        self.start_btn.config(state='normal')
+        self.fill_titles_btn.config(state='normal')
+        self.stop_btn.config(state='disabled')
+        self.status_label.config(text="标题补全完成")
+
+    def update_progress(self, value, stats=None):
+        """更新进度；stats 为流水线各阶段统计，显示在状态栏"""
         self.progress_var.set(value)
         self.status_label.config(text=f"进度: {int(value)}%")
+        if stats:
+            self.status_bar.config(text=StagePipeline.format_stats(stats))
         self.root.update_idletasks()
     
     def stop_download(self):
@@ -696,6 +781,8 @@ class HelpWindow:
 - 显示每页抓取到的番号数量
 - 支持复制和保存结果
 - 自动保存到标准list.txt文件
+- 增量抓取：勾选后只获取上次抓取之后新上架的番号（列表需按日期倒序），
+  遇到整页均为已知番号即停止翻页，新番号追加到list.txt
 
 ## 第二步：抓取磁链
 
@@ -706,10 +793,21 @@ class HelpWindow:
 4. 点击"开始获取"按钮
 5. 等待处理完成
 
+### 标题获取方式
+- **完整**：先下载FC2作品页获取标题，再搜索磁力（作品页无法访问时仍会搜索磁力）
+- **仅磁力**：不获取标题，每个番号只需一次请求
+- **延迟**：使用sukebei搜索结果的标题，缺少标题的番号可稍后点击"补全标题"获取
+
 ### 番号格式支持
 - 标准格式：FC2-PPV-1234567
-- 简写格式：1234567
-- 每行一个番号
+- 其他写法：FC2 PPV 1234567、FC2-1234567、PPV-1234567
+- 简写格式：1234567（单独的 6-8 位数字）
+- 每行一个番号，以 # 开头的内容为注释
+- 按输入顺序处理，重复番号只处理一次；日期、序号等其他数字会被忽略并在日志中列出
+
+### 断点续传
+处理被停止或程序意外退出后，勾选"断点续传"再点击"开始获取"，
+将跳过上次已完成的番号，只处理剩余部分（网络失败的番号会重新获取）。
 
 ### 结果输出
 程序会在下载目录中生成两个文件：
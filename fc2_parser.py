@@ -0,0 +1,383 @@
+# -*- coding:utf-8 -*-
+"""
+FC2资源收集器 - 页面解析模块
+正则在模块加载时统一预编译；列表页番号由 listing_ids 按作品卡片标记（str.find）切分后逐段提取，
+分页信息由 parse_pager 在定位到的分页区块内解析
+"""
+
+import re
+import time
+from base64 import b32decode
+from html import unescape
+from urllib.parse import urlparse
+
+
+# 列表页：作品卡片标记用 str.find 定位，卡片内的作品链接用以字面量开头的正则查找
+# （不以字面量开头的分支正则会在每个字符处尝试匹配，大页面上反而更慢）
+LISTING_CARD_MARKER = '<div class="c-cntCard-110-f">'
+RE_ARTICLE_LINK = re.compile(r'/article/(\d+)/')
+
+# 分页：先按分页链接定位分页区块，只在区块内提取分页链接与当前页标记（与属性顺序无关）
+PAGER_LINK_MARKER = 'data-link-name="pager"'
+PAGER_CURRENT_MARKER = 'aria-selected="true"'
+PAGER_MARGIN = 4096           # 当前页标记与首个/末个分页链接的最大距离（字符）
+PAGER_MAX_BLOCK = 64 * 1024   # 分页区块长度上限（字符）
+PAGER_TIME_BUDGET = 0.05      # 单页分页解析时间上限（秒），超出时返回已解析的部分
+RE_PAGER_TOKENS = re.compile(
+    r'<a (?P<link>[^>]*?data-link-name="pager"[^>]*)>'
+    r'|<(?:span|a|li) [^>]*?aria-selected="true"[^>]*>\s*(?P<current>\d+)\s*<'
+)
+RE_PAGER_PAGE = re.compile(r'href="[^"]*?[?&;]page=(\d+)"')
+
+# 页面路径 -> 页面类型
+RE_PATH_TYPES = (
+    (re.compile(r'^/users/[^/]+/articles'), 'user_articles'),
+    (re.compile(r'^/search/'), 'search_results'),
+    (re.compile(r'^/article/\d+/?$'), 'article_detail'),
+)
+
+# 作品详情页标题
+RE_ARTICLE_TITLE = re.compile(r'<h3[^>]*>([^<]+)</h3>')
+
+# sukebei 搜索结果：磁力链接与结果标题
+RE_MAGNET = re.compile(r'magnet:\?[^"\'\s]+')
+RE_MAGNET_XT = re.compile(r'<a href="magnet:\?xt=(.*?)&amp;dn=', re.S)
+RE_SEARCH_TITLE = re.compile(r'<a href="/view/\d+" title="([^"]+)"')
+
+# sukebei 结果行：每行一个种子，依次为 分类、标题、链接、大小、日期、做种、下载中、完成数
+RE_RESULT_ROW = re.compile(r'<tr[^>]*>(.*?)</tr>', re.S)
+RE_ROW_MAGNET = re.compile(r'href="(magnet:\?[^"]+)"')
+RE_ROW_SIZE = re.compile(r'<td[^>]*>\s*([\d.]+)\s*([KMGT]?i?B)\s*</td>')
+RE_ROW_NUMBER = re.compile(r'<td[^>]*>\s*(\d+)\s*</td>')
+RE_BTIH = re.compile(r'xt=urn:btih:([0-9A-Za-z]+)', re.IGNORECASE)
+SIZE_UNITS = {
+    'B': 1, 'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3, 'TiB': 1024 ** 4,
+    'KB': 1000, 'MB': 1000 ** 2, 'GB': 1000 ** 3, 'TB': 1000 ** 4,
+}
+
+# sukebei 每页结果数：合并查询的结果少于一页时，未出现在结果中的番号可确定为无磁力
+SUKEBEI_PAGE_SIZE = 75
+
+# 磁力排序方式 -> 排序键（越大越靠前）；默认 为页面原顺序
+RANK_POLICIES = {
+    '做种': lambda row: (row['seeders'], row['downloads']),
+    '下载': lambda row: (row['downloads'], row['seeders']),
+    '大小': lambda row: (row['size'], row['seeders']),
+    '默认': None,
+}
+
+# 用户输入中的候选番号，依次尝试：
+#   prefixed  带前缀：FC2-PPV-1234567、FC2 PPV 1234567、FC2PPV1234567、FC2-1234567、PPV-1234567
+#   code      其他字母编号（如 ABC-123），不是番号
+#   bare      单独的一段数字
+#   other     含全角等非 ASCII 数字的一段数字，不是番号（避免把这类字符写入请求网址）
+# 番号只接受 ASCII 数字 [0-9]；前后紧邻任何数字（含非 ASCII 数字）时整段不作为番号
+RE_INPUT_TOKEN = re.compile(
+    r'(?<![0-9A-Za-z])(?<!\d)(?:'
+    r'(?:FC2[-_ ]*(?:PPV[-_ ]*)?|PPV[-_ ]*)(?P<prefixed>[0-9]+)'
+    r'|(?P<code>(?!FC2(?![0-9]))[A-Za-z]+[-_]?[0-9]+)'
+    r'|(?P<bare>[0-9]+)'
+    r'|(?P<other>\d+)'
+    r')(?!\d)',
+    re.IGNORECASE)
+# 行首或空白之后的 # 到行尾为注释
+RE_INPUT_COMMENT = re.compile(r'(?:^|\s)#.*')
+# 番号位数：带前缀时 5-8 位，单独的数字 6-8 位（更短的多为序号、年份等）
+ID_DIGITS_PREFIXED = (5, 8)
+ID_DIGITS_BARE = (6, 8)
+
+# 流式读取的停止条件：sukebei 结果表格结束（其后只有分页与页脚）
+STOP_SEARCH_RESULTS = re.compile(r'</tbody>')
+
+
+def page_type_of(url, has_cards=False):
+    """按URL路径判断页面类型；路径无法识别但页面含作品卡片时为 list_unknown"""
+    try:
+        path = urlparse(url).path
+    except Exception:
+        path = ''
+    for pattern, page_type in RE_PATH_TYPES:
+        if pattern.search(path):
+            return page_type
+    return 'list_unknown' if has_cards else 'unknown'
+
+
+def locate_pager(html):
+    """
+    定位分页区块：首个到末个分页链接，并向前后各延伸 PAGER_MARGIN 以包含当前页标记。
+    返回 (区块, 是否完整)，没有分页链接时区块为空，超过 PAGER_MAX_BLOCK 时截断。
+    """
+    html = html or ''
+    first = html.find(PAGER_LINK_MARKER)
+    if first < 0:
+        return '', True
+    last = html.rfind(PAGER_LINK_MARKER)
+    before = html.rfind(PAGER_CURRENT_MARKER, max(0, first - PAGER_MARGIN), first)
+    after = html.find(PAGER_CURRENT_MARKER, last, last + PAGER_MARGIN)
+    start = max(html.rfind('<', 0, before if before >= 0 else first), 0)
+    close = html.find('</', max(last, after))
+    end = len(html) if close < 0 else html.find('>', close) + 1 or len(html)
+    if end - start > PAGER_MAX_BLOCK:
+        return html[start:start + PAGER_MAX_BLOCK], False
+    return html[start:end], True
+
+
+def parse_pager(html, budget=PAGER_TIME_BUDGET):
+    """
+    解析分页，返回 {'current_page','next_page','last_page','pages','pager_ok'}。
+    下一页为大于当前页的最小页码，末页为最大页码；
+    有分页链接却找不到当前页标记（页面结构变化）、区块被截断或超出时间上限时 pager_ok 为 False，
+    此时不推断下一页。
+    """
+    deadline = time.perf_counter() + budget
+    current = None
+    pages = set()
+    block, complete = locate_pager(html)
+    for count, m in enumerate(RE_PAGER_TOKENS.finditer(block), 1):
+        if count % 32 == 0 and time.perf_counter() > deadline:
+            complete = False
+            break
+        if m.lastgroup == 'link':
+            page = RE_PAGER_PAGE.search(m.group('link'))
+            if page:
+                pages.add(int(page.group(1)))
+        elif current is None:
+            current = int(m.group('current'))
+    pager_ok = complete and (current is not None or not pages)
+    current_page = current or 1
+    next_page = min((p for p in pages if p > current_page), default=0) if pager_ok else 0
+    return {
+        'current_page': current_page,
+        'next_page': next_page,
+        'last_page': max(pages | {current_page}) if pages else 0,
+        'pages': sorted(pages),
+        'pager_ok': pager_ok,
+    }
+
+
+def parse_listing(html, url=''):
+    """
+    解析作品列表页，返回 {'page_type','ids','current_page','next_page','last_page','pager_ok'}。
+    番号见 listing_ids，分页见 parse_pager。
+    """
+    html = html or ''
+    pager = parse_pager(html)
+    return {
+        'page_type': page_type_of(url, LISTING_CARD_MARKER in html),
+        'ids': listing_ids(html),
+        'current_page': pager['current_page'],
+        'next_page': pager['next_page'],
+        'last_page': pager['last_page'],
+        'pager_ok': pager['pager_ok'],
+    }
+
+
+def listing_ids(html):
+    """
+    列表页中的番号：取每个作品卡片内的第一个作品链接，页面没有卡片（或卡片内没有链接）时取全部作品链接，
+    去重并保持顺序
+    """
+    html = html or ''
+    card_ids = []
+    end = html.find(LISTING_CARD_MARKER)
+    while end != -1:
+        start = end + len(LISTING_CARD_MARKER)
+        end = html.find(LISTING_CARD_MARKER, start)
+        m = RE_ARTICLE_LINK.search(html, start, len(html) if end == -1 else end)
+        if m:
+            card_ids.append(m.group(1))
+    return _unique(card_ids or RE_ARTICLE_LINK.findall(html))
+
+
+def current_page(html):
+    """当前页码，无分页时为 1"""
+    return parse_pager(html)['current_page']
+
+
+def next_page(html):
+    """下一页页码，已是最后一页或无法识别分页时为 0"""
+    return parse_pager(html)['next_page']
+
+
+def last_page(html):
+    """末页页码（分页中的最大页码），无分页时为 0"""
+    return parse_pager(html)['last_page']
+
+
+def parse_article(html):
+    """解析作品详情页：标题"""
+    m = RE_ARTICLE_TITLE.search(html or '')
+    return {'title': m.group(1).strip() if m else ''}
+
+
+def parse_search(html):
+    """
+    解析 sukebei 搜索结果页：{'magnets': 页面中的全部磁力, 'title': 首条结果标题, 'rows': 结果行}，
+    结果行见 parse_result_rows
+    """
+    magnets = list(set(RE_MAGNET.findall(html or '')))
+    m = RE_SEARCH_TITLE.search(html or '')
+    return {
+        'magnets': magnets,
+        'title': unescape(m.group(1)).strip() if m else '',
+        'rows': parse_result_rows(html),
+    }
+
+
+def parse_result_rows(html):
+    """
+    逐行解析 sukebei 搜索结果，返回
+    [{'magnet','infohash','title','size','seeders','leechers','downloads'}]（页面顺序，size 为字节数）。
+    没有磁力链接的行（表头等）被跳过。
+    """
+    rows = []
+    for row in RE_RESULT_ROW.finditer(html or ''):
+        cells = row.group(1)
+        magnet = RE_ROW_MAGNET.search(cells)
+        if not magnet:
+            continue
+        magnet = unescape(magnet.group(1))
+        title = RE_SEARCH_TITLE.search(cells)
+        size = RE_ROW_SIZE.search(cells)
+        numbers = [int(n) for n in RE_ROW_NUMBER.findall(cells)][-3:]
+        seeders, leechers, downloads = [0] * (3 - len(numbers)) + numbers
+        rows.append({
+            'magnet': magnet,
+            'infohash': infohash_of(magnet),
+            'title': unescape(title.group(1)).strip() if title else '',
+            'size': int(float(size.group(1)) * SIZE_UNITS.get(size.group(2), 1)) if size else 0,
+            'seeders': seeders,
+            'leechers': leechers,
+            'downloads': downloads,
+        })
+    return rows
+
+
+def rank_rows(rows, policy='做种', top=0):
+    """
+    按排序方式（RANK_POLICIES）排列结果行，同一信息哈希只保留排在最前的一行，
+    top 大于 0 时只保留前 top 个
+    """
+    key = RANK_POLICIES.get(policy)
+    ranked = sorted(rows, key=key, reverse=True) if key else list(rows)
+    seen = set()
+    unique = []
+    for row in ranked:
+        torrent = row['infohash'] or row['magnet']
+        if torrent not in seen:
+            seen.add(torrent)
+            unique.append(row)
+    return unique[:top] if top > 0 else unique
+
+
+def batch_query(fc2_ids):
+    """合并查询的搜索词：FC2 PPV (番号1|番号2|...)，sukebei 搜索中 | 为“或”"""
+    return 'FC2 PPV (' + '|'.join(fc2_ids) + ')'
+
+
+def attribute_rows(rows, fc2_ids):
+    """
+    按结果标题中的番号把合并查询的结果行分配给各番号，返回 {番号: [结果行]}（保持页面顺序）。
+    番号前后不能紧邻数字；标题含多个番号的行（合集）分配给其中每个番号。
+    """
+    if not fc2_ids:
+        return {}
+    pattern = re.compile(r'(?<!\d)(' + '|'.join(map(re.escape, fc2_ids)) + r')(?!\d)')
+    attributed = {}
+    for row in rows:
+        for fc2_id in _unique(pattern.findall(row['title'])):
+            attributed.setdefault(fc2_id, []).append(row)
+    return attributed
+
+
+def infohash_of(magnet):
+    """磁力链接中的 btih 信息哈希，统一为 40 位小写十六进制；无法识别时返回空字符串"""
+    m = RE_BTIH.search(magnet or '')
+    if not m:
+        return ''
+    value = m.group(1)
+    if len(value) == 32:
+        try:
+            return b32decode(value.upper()).hex()
+        except Exception:
+            return ''
+    return value.lower() if len(value) == 40 else ''
+
+
+def first_magnet(html):
+    """搜索结果页中的第一个磁力链接（仅保留 xt 部分），没有时返回 None"""
+    m = RE_MAGNET_XT.search(html or '')
+    return 'magnet:?xt=' + m.group(1) if m else None
+
+
+def label_id(label):
+    """番号列表中一行（如 FC2 1234567）的番号，没有时返回空字符串"""
+    fc2_ids, _ = tokenize_input_ids(label)
+    return fc2_ids[0] if fc2_ids else ''
+
+
+def tokenize_input_ids(text):
+    """
+    解析用户输入中的番号，返回 (番号列表, 被拒绝的内容)。
+    番号按首次出现的顺序去重；# 注释被忽略；
+    被拒绝的内容为 [(行号, 原文)]：位数不符的数字、其他字母编号、全角等非 ASCII 数字等。
+    """
+    fc2_ids = []
+    rejected = []
+    for line_number, line in enumerate((text or '').splitlines(), 1):
+        for m in RE_INPUT_TOKEN.finditer(RE_INPUT_COMMENT.sub('', line)):
+            if m.lastgroup == 'prefixed':
+                digits = ID_DIGITS_PREFIXED
+            elif m.lastgroup == 'bare':
+                digits = ID_DIGITS_BARE
+            else:
+                rejected.append((line_number, m.group(0)))
+                continue
+            fc2_id = m.group(m.lastgroup)
+            if digits[0] <= len(fc2_id) <= digits[1]:
+                fc2_ids.append(fc2_id)
+            else:
+                rejected.append((line_number, m.group(0)))
+    return _unique(fc2_ids), rejected
+
+
+class StreamScanner:
+    """
+    流式增量扫描：逐块喂入已解码的文本，stop 在已读内容中出现后 feed 返回 True，
+    调用方即可停止读取响应。跨块的匹配通过保留上一块末尾 overlap 个字符处理。
+    """
+
+    def __init__(self, stop, overlap=1024):
+        self.stop = stop
+        self.overlap = overlap
+        self.done = False
+        self.size = 0
+        self._parts = []
+        self._tail = ''
+
+    def feed(self, chunk):
+        """喂入一块文本，返回是否已满足停止条件"""
+        if self.done or not chunk:
+            return self.done
+        self._parts.append(chunk)
+        self.size += len(chunk)
+        window = self._tail + chunk
+        if self.stop.search(window):
+            self.done = True
+        self._tail = window[-self.overlap:]
+        return self.done
+
+    @property
+    def text(self):
+        """已读取的内容"""
+        return ''.join(self._parts)
+
+
+def _unique(items):
+    seen = set()
+    ordered = []
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+            ordered.append(item)
+    return ordered
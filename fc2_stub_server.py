@@ -0,0 +1,319 @@
+# -*- coding:utf-8 -*-
+"""
+FC2资源收集器 - 本地模拟服务器（压测用）
+在本机模拟 FC2 卖家作品列表页/作品详情页与 sukebei 搜索结果页，可注入延迟、429/5xx 与连接重置。
+两个站点分别监听两个端口，把 config.ini 中的 FC2_base_url / Sukebei_base_url 指向它们即可，
+限速、缓存等按站点区分的设置照常生效。
+
+用法：python fc2_stub_server.py [--fc2-port 8765] [--sukebei-port 8766] [--pages 20] [--cards 60]
+                                [--latency 50] [--jitter 20] [--rate-429 0.02] [--rate-5xx 0.01] [--rate-reset 0.01]
+统计：GET /__stats 返回各站点的请求数与注入的错误数（JSON）
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import socket
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# 默认参数，可由命令行或 start_servers(**options) 覆盖
+DEFAULT_OPTIONS = {
+    'pages': 20,          # 每个卖家的列表页数
+    'cards': 60,          # 每页作品数
+    'magnets': 3,         # 每个番号最多的种子数（部分番号没有种子）
+    'pad_kb': 40,         # 页面填充大小（KB），模拟真实页面的脚本与样式
+    'latency': 0.0,       # 每个请求的基础延迟（毫秒）
+    'jitter': 0.0,        # 延迟的随机波动（毫秒）
+    'rate_429': 0.0,      # 返回 429 的概率
+    'rate_5xx': 0.0,      # 返回 500/502/503 的概率
+    'rate_reset': 0.0,    # 直接重置连接的概率
+    'retry_after': 1,     # 429 响应的 Retry-After（秒）
+    'seed': 0,            # 随机数种子（内容固定，只影响注入的延迟与错误）
+}
+
+# sukebei 每页最多结果数
+RESULTS_PER_PAGE = 75
+
+RE_QUERY_ID = re.compile(r'(?<!\d)(\d{5,8})(?!\d)')
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def seller_base_id(seller):
+    """卖家的起始番号（按卖家名固定）"""
+    return 1000000 + int(_digest(seller)[:8], 16) % 3000000
+
+
+def torrent_count(fc2_id, max_magnets):
+    """番号在模拟 sukebei 上的种子数（按番号固定，约四分之一没有种子）"""
+    value = int(_digest('t' + str(fc2_id))[:8], 16)
+    if value % 4 == 0:
+        return 0
+    return 1 + value % max(1, max_magnets)
+
+
+def padding(options):
+    return '<script>var pad = "' + 'x' * (options['pad_kb'] * 1024) + '";</script>'
+
+
+def render_listing(seller, page, options):
+    """卖家作品列表页：作品卡片与分页（与正式站点的卡片/分页标记一致）"""
+    pages = options['pages']
+    cards = options['cards']
+    base = seller_base_id(seller) + (page - 1) * cards
+    items = []
+    for i in range(cards):
+        fc2_id = base + i
+        items.append(
+            '<div class="c-cntCard-110-f"><div class="c-cntCard-110-f_thumb">'
+            f'<a href="/article/{fc2_id}/"><img src="/img/{fc2_id}.jpg" alt=""></a></div>'
+            f'<div class="c-cntCard-110-f_itemName"><a href="/article/{fc2_id}/" title="作品 {fc2_id}">'
+            f'作品 {fc2_id}</a></div></div>'
+        )
+    pager = ['<div class="c-pager-101">']
+    for p in range(max(1, page - 5), min(pages, page + 5) + 1):
+        if p == page:
+            pager.append(f'<span class="items" aria-selected="true">{p}</span>')
+        else:
+            pager.append(
+                '<a data-pjx="pjx-container" data-link-name="pager" '
+                f'href="/users/{seller}/articles?sort=date&amp;order=desc&amp;page={p}" class="items">{p}</a>'
+            )
+    if page + 5 < pages:
+        pager.append(
+            '<a data-pjx="pjx-container" data-link-name="pager" '
+            f'href="/users/{seller}/articles?sort=date&amp;order=desc&amp;page={pages}" class="items">{pages}</a>'
+        )
+    pager.append('</div>')
+    return ('<html><head>' + padding(options) + '</head><body>'
+            + ''.join(items) + ''.join(pager) + '</body></html>')
+
+
+def render_article(fc2_id, options):
+    """作品详情页"""
+    return (f'<html><head>{padding(options)}</head><body>'
+            f'<h3>FC2-PPV-{fc2_id} 模拟作品 {fc2_id}</h3></body></html>')
+
+
+def render_search(query, options):
+    """sukebei 搜索结果页：查询中每个番号的种子各占一行（支持 a|b 合并查询），最多一页"""
+    rows = []
+    for fc2_id in dict.fromkeys(RE_QUERY_ID.findall(query)):
+        for k in range(torrent_count(fc2_id, options['magnets'])):
+            infohash = _digest(f'{fc2_id}-{k}')
+            view = int(infohash[:6], 16)
+            seeders = int(infohash[6:8], 16) % 50
+            rows.append(
+                '<tr class="default">'
+                '<td><a href="/?c=2_2" title="Real Life - Videos">分类</a></td>'
+                f'<td colspan="2"><a href="/view/{view}" title="FC2-PPV-{fc2_id} 模拟种子 {k}">FC2-PPV-{fc2_id} 模拟种子 {k}</a></td>'
+                f'<td class="text-center"><a href="/download/{view}.torrent"></a>'
+                f'<a href="magnet:?xt=urn:btih:{infohash}&amp;dn=FC2-PPV-{fc2_id}"></a></td>'
+                f'<td class="text-center">{1 + k * 0.5:.1f} GiB</td>'
+                '<td class="text-center" data-timestamp="1700000000">2023-11-14 22:13</td>'
+                f'<td class="text-center">{seeders}</td><td class="text-center">{k}</td>'
+                f'<td class="text-center">{seeders * 3}</td></tr>'
+            )
+    rows = rows[:RESULTS_PER_PAGE]
+    return ('<html><head>' + padding(options) + '</head><body><table class="torrent-list"><thead>'
+            '<tr><th>Category</th><th>Name</th></tr></thead><tbody>' + ''.join(rows)
+            + '</tbody></table><ul class="pagination"></ul>'
+            + '<footer>' + 'f' * (options['pad_kb'] * 512) + '</footer></body></html>')
+
+
+class StubState:
+    """两个站点共享的参数、随机数与统计"""
+
+    def __init__(self, options):
+        self.options = dict(DEFAULT_OPTIONS, **options)
+        self._random = random.Random(self.options['seed'])
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def count(self, site, key):
+        with self._lock:
+            site_stats = self.stats.setdefault(site, {})
+            site_stats[key] = site_stats.get(key, 0) + 1
+
+    def draw(self):
+        """本次请求的 (延迟秒数, 注入的故障：None/429/5xx/reset)"""
+        opts = self.options
+        with self._lock:
+            delay = max(0.0, opts['latency'] + self._random.uniform(-opts['jitter'], opts['jitter'])) / 1000
+            roll = self._random.random()
+            status = self._random.choice((500, 502, 503))
+        if roll < opts['rate_reset']:
+            return delay, 'reset'
+        roll -= opts['rate_reset']
+        if roll < opts['rate_429']:
+            return delay, 429
+        roll -= opts['rate_429']
+        if roll < opts['rate_5xx']:
+            return delay, status
+        return delay, None
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """模拟站点的请求处理：先注入延迟与故障，再由 render() 生成页面"""
+
+    site = ''
+    protocol_version = 'HTTP/1.1'
+    # 响应头与响应体分两次写出，关闭 Nagle 避免与客户端的延迟确认叠加出 40ms 等待
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        state = self.server.state
+        parsed = urlparse(self.path)
+        if parsed.path == '/__stats':
+            self.respond(200, json.dumps(state.stats, ensure_ascii=False), 'application/json')
+            return
+        state.count(self.site, 'requests')
+        delay, fault = state.draw()
+        if delay:
+            time.sleep(delay)
+        if fault == 'reset':
+            state.count(self.site, 'reset')
+            # SO_LINGER=0 后关闭，客户端收到 RST
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            self.connection.close()
+            self.close_connection = True
+            return
+        if fault is not None:
+            state.count(self.site, str(fault))
+            headers = {'Retry-After': str(state.options['retry_after'])} if fault == 429 else {}
+            self.respond(fault, 'error', headers=headers)
+            return
+        page = self.render(parsed.path, parse_qs(parsed.query), state.options)
+        if page is None:
+            state.count(self.site, '404')
+            self.respond(404, 'not found')
+        else:
+            state.count(self.site, '200')
+            self.respond(200, page)
+
+    def render(self, path, query, options):
+        return None
+
+    def respond(self, status, body, content_type='text/html; charset=utf-8', headers=None):
+        data = body.encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FC2StubHandler(StubHandler):
+    site = 'fc2'
+
+    def render(self, path, query, options):
+        m = re.match(r'^/users/([^/]+)/articles/?$', path)
+        if m:
+            try:
+                page = int(query.get('page', ['1'])[0])
+            except ValueError:
+                page = 1
+            if not 1 <= page <= options['pages']:
+                return None
+            return render_listing(m.group(1), page, options)
+        m = re.match(r'^/article/(\d+)/?$', path)
+        if m:
+            return render_article(m.group(1), options)
+        return None
+
+
+class SukebeiStubHandler(StubHandler):
+    site = 'sukebei'
+
+    def render(self, path, query, options):
+        if path != '/':
+            return None
+        return render_search(query.get('q', [''])[0], options)
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    """客户端提前断开（流式读取读够即关闭连接）属正常情况，不输出错误"""
+
+    daemon_threads = True
+    # 默认的监听队列（5）在大量并发连接同时建立时溢出，客户端要等约 1 秒后重发 SYN
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            super().handle_error(request, client_address)
+
+
+def start_servers(host='127.0.0.1', fc2_port=0, sukebei_port=0, **options):
+    """
+    在后台线程启动两个模拟站点，返回 (FC2 地址, sukebei 地址, 停止函数, 共享状态)；
+    端口为 0 时自动分配
+    """
+    state = StubState(options)
+    servers = []
+    for handler, port in ((FC2StubHandler, fc2_port), (SukebeiStubHandler, sukebei_port)):
+        server = StubHTTPServer((host, port), handler)
+        server.state = state
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+
+    def stop():
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+    urls = [f'http://{host}:{server.server_address[1]}' for server in servers]
+    return urls[0], urls[1], stop, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FC2/sukebei 本地模拟服务器（压测用）')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--fc2-port', type=int, default=8765, help='FC2 模拟站点端口')
+    parser.add_argument('--sukebei-port', type=int, default=8766, help='sukebei 模拟站点端口')
+    parser.add_argument('--pages', type=int, default=DEFAULT_OPTIONS['pages'], help='每个卖家的列表页数')
+    parser.add_argument('--cards', type=int, default=DEFAULT_OPTIONS['cards'], help='每页作品数')
+    parser.add_argument('--magnets', type=int, default=DEFAULT_OPTIONS['magnets'], help='每个番号最多的种子数')
+    parser.add_argument('--pad-kb', type=int, default=DEFAULT_OPTIONS['pad_kb'], help='页面填充大小（KB）')
+    parser.add_argument('--latency', type=float, default=DEFAULT_OPTIONS['latency'], help='基础延迟（毫秒）')
+    parser.add_argument('--jitter', type=float, default=DEFAULT_OPTIONS['jitter'], help='延迟随机波动（毫秒）')
+    parser.add_argument('--rate-429', type=float, default=DEFAULT_OPTIONS['rate_429'], help='返回 429 的概率')
+    parser.add_argument('--rate-5xx', type=float, default=DEFAULT_OPTIONS['rate_5xx'], help='返回 5xx 的概率')
+    parser.add_argument('--rate-reset', type=float, default=DEFAULT_OPTIONS['rate_reset'], help='重置连接的概率')
+    parser.add_argument('--retry-after', type=int, default=DEFAULT_OPTIONS['retry_after'], help='429 的 Retry-After（秒）')
+    parser.add_argument('--seed', type=int, default=DEFAULT_OPTIONS['seed'], help='随机数种子')
+    args = parser.parse_args()
+
+    options = {key: getattr(args, key) for key in DEFAULT_OPTIONS}
+    fc2_url, sukebei_url, stop, state = start_servers(args.host, args.fc2_port, args.sukebei_port, **options)
+    print('模拟服务器已启动，在 config.ini 中设置：')
+    print(f'FC2_base_url = {fc2_url}')
+    print(f'Sukebei_base_url = {sukebei_url}')
+    print(f'示例列表页：{fc2_url}/users/example/articles?sort=date&order=desc')
+    print('按 Ctrl+C 停止')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(state.stats, ensure_ascii=False))
+        stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -18,5 +18,5 @@ def _copy_from_meipass(filename: str) -> None:
         pass
 
 
-for _name in ["ico.ico", "README.md", "fc2_core.py"]:
+for _name in ["ico.ico", "README.md", "fc2_core.py", "fc2_parser.py"]:
     _copy_from_meipass(_name)
\ No newline at end of file
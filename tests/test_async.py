@@ -0,0 +1,134 @@
+# -*- coding:utf-8 -*-
+import asyncio
+import gzip
+
+import pytest
+import requests
+
+import fc2_parser
+from fc2_async import AsyncHttpClient
+from fc2_core import ARCHIVE_RECORD, ARCHIVE_REPLAY, HttpArchive, MetricsRegistry, site_of
+from fc2_stub_server import start_servers
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**options):
+        fc2_url, sukebei_url, stop, state = start_servers(**options)
+        servers.append(stop)
+        return sukebei_url, state
+    yield start
+    for stop in servers:
+        stop()
+
+
+def fetch(client, urls, stop=None):
+    """在一个事件循环里依次请求 urls，返回 [(状态码, 文本)]"""
+    async def run():
+        try:
+            return [await client.get(url, stop=stop) for url in urls]
+        finally:
+            await client.close()
+    return asyncio.run(run())
+
+
+def test_get_matches_requests_and_reuses_connection(stub):
+    sukebei_url, state = stub(pad_kb=4)
+    urls = [sukebei_url + f'/?f=0&c=0_0&q=FC2-PPV-{fc2_id}' for fc2_id in (1234567, 2345678)]
+
+    async def run():
+        client = AsyncHttpClient()
+        results = [await client.get(url) for url in urls]
+        idle = sum(len(connections) for connections in client._idle.values())
+        await client.close()
+        return results, idle
+    results, idle = asyncio.run(run())
+    for url, (status, text) in zip(urls, results):
+        assert status == 200
+        assert text == requests.get(url).text
+    # 两次请求复用同一条连接
+    assert idle == 1
+
+
+def test_stream_stops_at_results(stub):
+    sukebei_url, state = stub(pad_kb=64)
+    url = sukebei_url + '/?f=0&c=0_0&q=FC2-PPV-1234567'
+    (status, text), = fetch(AsyncHttpClient(), [url], stop=fc2_parser.STOP_SEARCH_RESULTS)
+    full = requests.get(url).text
+    assert status == 200
+    assert '</tbody>' in text
+    assert len(text) < len(full)
+    assert fc2_parser.parse_result_rows(text) == fc2_parser.parse_result_rows(full)
+
+
+def test_chunked_gzip_body():
+    """分块传输 + gzip 压缩的响应按块解压解码"""
+    page = '<table><tbody>' + '磁力' * 5000 + '</tbody></table>'
+    body = gzip.compress(page.encode('utf-8'))
+
+    async def handle(reader, writer):
+        while await reader.readline() not in (b'\r\n', b''):
+            pass
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Encoding: gzip\r\nTransfer-Encoding: chunked\r\n\r\n')
+        for i in range(0, len(body), 1000):
+            piece = body[i:i + 1000]
+            writer.write(b'%x\r\n%s\r\n' % (len(piece), piece))
+            await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def run():
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        client = AsyncHttpClient()
+        try:
+            return await client.get(f'http://127.0.0.1:{port}/')
+        finally:
+            await client.close()
+            server.close()
+    assert asyncio.run(run()) == (200, page)
+
+
+def test_retries_429_then_returns_status(stub):
+    """429/5xx 按 attempts 重试，用尽后返回最后的状态码；请求与重试计入指标"""
+    sukebei_url, state = stub(rate_429=1.0, retry_after=0)
+    metrics = MetricsRegistry()
+    url = sukebei_url + '/?q=FC2-PPV-1234567'
+    (status, text), = fetch(AsyncHttpClient(attempts=3, metrics=metrics), [url])
+    assert (status, text) == (429, None)
+    assert state.stats['sukebei']['429'] == 3
+    stats = metrics.snapshot()[site_of(url)]
+    assert stats['requests'] == 3
+    assert stats['retries'] == 2
+    assert stats['status'] == {'429': 3}
+
+
+def test_archive_record_then_replay(stub, tmp_path):
+    """录制时读取完整响应写入存档，回放时不访问网络"""
+    sukebei_url, state = stub(pad_kb=4)
+    url = sukebei_url + '/?f=0&c=0_0&q=FC2 1234567'
+    path = str(tmp_path / 'archive.db')
+    recorder = HttpArchive(path, ARCHIVE_RECORD)
+    (status, recorded), = fetch(AsyncHttpClient(archive=recorder), [url], stop=fc2_parser.RE_MAGNET_XT)
+    recorder.close()
+    assert status == 200
+    requests_before = state.stats['sukebei']['requests']
+    player = HttpArchive(path, ARCHIVE_REPLAY)
+    (status, replayed), = fetch(AsyncHttpClient(archive=player), [url])
+    assert (status, replayed) == (200, recorded)
+    assert state.stats['sukebei']['requests'] == requests_before
+    # 同一存档也能被 requests 会话回放（URL 规范化一致）
+    session = requests.Session()
+    player.mount(session)
+    assert session.get(url).text == recorded
+    player.close()
+
+
+def test_only_http_proxies_supported():
+    assert AsyncHttpClient.supports_proxy('')
+    assert AsyncHttpClient.supports_proxy('http://127.0.0.1:7890')
+    assert not AsyncHttpClient.supports_proxy('socks5://127.0.0.1:7890')
+    with pytest.raises(ValueError):
+        AsyncHttpClient('socks5://127.0.0.1:7890')
@@ -0,0 +1,68 @@
+# -*- coding:utf-8 -*-
+import configparser
+import os
+
+from fc2_core import FC2GatherCore, ResultStore, STATUS_ERROR, STATUS_FOUND, STATUS_NO_MAGNET
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_core(settings):
+    config = configparser.RawConfigParser()
+    config['下载设置'] = settings
+    return FC2GatherCore(config, log_callback=lambda message: None)
+
+
+def test_stage_workers_follow_max_dl():
+    """只设置 Max_dl 时两个阶段的线程数都等于 Max_dl"""
+    core = make_core({'Max_dl': '5'})
+    assert core.get_stage_workers('fc2') == 5
+    assert core.get_stage_workers('sukebei') == 5
+
+
+def test_stage_workers_blank_falls_back_to_max_dl():
+    core = make_core({'Max_dl': '6', 'Workers_fc2': '', 'Workers_sukebei': '3'})
+    assert core.get_stage_workers('fc2') == 6
+    assert core.get_stage_workers('sukebei') == 3
+
+
+def test_shipped_config_does_not_pin_stage_workers():
+    """附带的 config.ini 不固定阶段线程数，修改 Max_dl 即生效"""
+    config = configparser.RawConfigParser()
+    config.read(os.path.join(ROOT, 'config.ini'), encoding='utf-8')
+    config.set('下载设置', 'Max_dl', '7')
+    core = FC2GatherCore(config, log_callback=lambda message: None)
+    assert core.get_stage_workers('fc2') == 7
+    assert core.get_stage_workers('sukebei') == 7
+
+
+def test_ids_with_magnet_single_query(tmp_path):
+    """已有磁力的番号由一次查询得出；状态改为失败后不再残留旧磁力"""
+    store = ResultStore.open_in(str(tmp_path))
+    try:
+        store.record('FC2-PPV-1111111', STATUS_FOUND, magnets=['magnet:?xt=urn:btih:' + 'a' * 40])
+        store.record('FC2-PPV-2222222', STATUS_NO_MAGNET)
+        assert store.ids_with_magnet(['FC2 PPV 1111111', '2222222', '3333333']) == {'1111111'}
+        store.record('1111111', STATUS_ERROR)
+        assert store.ids_with_magnet(['1111111']) == set()
+        assert store.get_items(['1111111'])['1111111']['magnets'] == []
+    finally:
+        store.close()
+
+
+def test_open_cache_reuses_same_path(tmp_path):
+    """同一下载目录再次打开缓存时沿用已打开的缓存（连接与统计不变），只更新有效期与大小上限"""
+    core = make_core({'Cache_size_mb': '10'})
+    try:
+        cache = core.open_cache(str(tmp_path))
+        cache.lookup('https://sukebei.nyaa.si/?q=1')
+        since = cache.snapshot()
+        core.config.set('下载设置', 'Cache_size_mb', '20')
+        assert core.open_cache(str(tmp_path)) is cache
+        assert cache.stats['misses'] == 1
+        assert cache.max_bytes == 20 * 1024 * 1024
+        assert cache.summary(since).startswith('命中 0，未命中 0')
+        other = core.open_cache(str(tmp_path / 'other'))
+        assert other is not cache
+    finally:
+        core.cache.close()
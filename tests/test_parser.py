@@ -0,0 +1,41 @@
+# -*- coding:utf-8 -*-
+import fc2_parser
+
+CARD = '<div class="c-cntCard-110-f">'
+
+
+def test_listing_ids_first_link_per_card():
+    html = (CARD + '<a href="/article/1111111/"><img></a><a href="/article/1111111/">t</a>'
+            '<a href="/article/9999999/">推荐</a></div>'
+            + CARD + '<a href="/article/2222222/">t</a></div>')
+    assert fc2_parser.listing_ids(html) == ['1111111', '2222222']
+
+
+def test_listing_ids_without_cards_uses_all_links():
+    html = '<a href="/article/3333333/">a</a><a href="/article/4444444/">b</a><a href="/article/3333333/">'
+    assert fc2_parser.listing_ids(html) == ['3333333', '4444444']
+    assert fc2_parser.listing_ids('') == []
+
+
+def test_parse_listing_page_type_and_ids():
+    html = CARD + '<a href="/article/5555555/">t</a></div>'
+    parsed = fc2_parser.parse_listing(html, 'https://adult.contents.fc2.com/users/x/articles?page=2')
+    assert parsed['page_type'] == 'user_articles'
+    assert parsed['ids'] == ['5555555']
+
+
+def test_tokenize_input_ids_keeps_order_and_reports_rejects():
+    text = '# 注释 1111111\nFC2-PPV-3333333\n2024-01-01 FC2 PPV 2222222\nABC-123 3333333'
+    fc2_ids, rejected = fc2_parser.tokenize_input_ids(text)
+    assert fc2_ids == ['3333333', '2222222']
+    assert (3, '2024') in rejected
+    assert (4, 'ABC-123') in rejected
+
+
+def test_tokenize_input_ids_rejects_non_ascii_digits():
+    """全角等非 ASCII 数字不作为番号，并作为被拒绝的内容报告"""
+    text = 'FC2-PPV-１２３４５６７\n１２３４５６７\n123456７\n٣٣٣٣٣٣٣\n4444444'
+    fc2_ids, rejected = fc2_parser.tokenize_input_ids(text)
+    assert fc2_ids == ['4444444']
+    assert [token for _, token in rejected] == ['１２３４５６７', '１２３４５６７', '123456７', '٣٣٣٣٣٣٣']
+    assert fc2_parser.label_id('FC2 １２３４５６７') == ''